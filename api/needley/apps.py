@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class NeedleyConfig(AppConfig):
     name = 'needley'
     verbose_name = 'Needley main API application'
+
+    def ready(self):
+        from . import auth, cache, content, metrics, stats
+        auth.connect_signals()
+        cache.connect_signals()
+        content.connect_signals()
+        metrics.connect_signals()
+        stats.connect_signals()
+        checks.register(auth.check_shared_caches, checks.Tags.caches, deploy=True)
@@ -12,5 +12,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'needley.settings')
+# Serve /graphql with AsyncGraphQLView (see settings.GRAPHQL_ASYNC_VIEW)
+os.environ.setdefault('NEEDLEY_ASYNC_GRAPHQL', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the apps are ready.
+from needley.subscriptions import application as websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # GraphQL subscriptions are served over WebSocket; everything else by Django.
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,109 @@
+"""Authentication backend that keeps logged-in users in the cache.
+
+With cached sessions (SESSION_ENGINE = cached_db) this means that
+AuthenticationMiddleware resolves `request.user` without touching the
+database. Cached users are dropped whenever the row is saved or deleted,
+so profile and password changes (which also end other sessions through
+the session auth hash) apply on the next request. Writes that bypass
+model signals, such as `QuerySet.update()`, must call `invalidate_user`.
+
+Both the session cache and AUTH_USER_CACHE must be shared by every
+process serving the API; with a per-process cache (LocMemCache) the other
+processes would keep serving a session or user after it changed. `manage.py
+check --deploy` warns about that.
+
+Passwords are checked in the worker pool of needley/passwords.py, and
+hashes made with an older hasher are upgraded on the next login.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from . import passwords
+
+User = get_user_model()
+
+USER_KEY = 'auth-user:%s'
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE', 'default')]
+
+
+def invalidate_user(user_id, using=None):
+    key = USER_KEY % user_id
+    cache = get_cache()
+    # Again after the write on database `using` commits, in case a request
+    # cached the old row meanwhile.
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key), using=using)
+
+
+def invalidate_on_write(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def connect_signals():
+    post_save.connect(invalidate_on_write, sender=User,
+                      dispatch_uid='auth-user-cache-save')
+    post_delete.connect(invalidate_on_write, sender=User,
+                        dispatch_uid='auth-user-cache-delete')
+
+
+def check_shared_caches(app_configs=None, **kwargs):
+    aliases = {getattr(settings, 'AUTH_USER_CACHE', 'default')}
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db':
+        aliases.add(settings.SESSION_CACHE_ALIAS)
+    # run_tasks invalidates cached responses (e.g. after recounting authors).
+    if getattr(settings, 'GRAPHQL_RESPONSE_CACHE', None):
+        aliases.add(settings.GRAPHQL_RESPONSE_CACHE)
+    return [
+        checks.Warning(
+            'Cache %r is local to each process, so data changed in one process '
+            'stays cached in the others.' % alias,
+            hint='Point it at a shared backend, e.g. set MEMCACHED_LOCATION.',
+            id='needley.W001',
+        )
+        for alias in sorted(aliases) if isinstance(caches[alias], LocMemCache)
+    ]
+
+
+class CachedModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # ModelBackend.authenticate, with the hashing done by the worker pool.
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway so that timing does not reveal which usernames exist.
+            passwords.make_password(password)
+            return None
+
+        (valid, must_update) = passwords.check_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            # e.g. a PBKDF2 hash from before argon2 became the default.
+            user.password = passwords.make_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+    def get_user(self, user_id):
+        cache = get_cache()
+        key = USER_KEY % user_id
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, getattr(
+                settings, 'AUTH_USER_CACHE_TIMEOUT', 300))
+        return user if self.user_can_authenticate(user) else None
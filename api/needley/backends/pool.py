@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections shared by all threads.
+
+    `getconn` hands out an idle connection, opens a new one while fewer than
+    `max_size` exist, and otherwise waits up to `timeout` seconds for one to
+    be returned. Time spent waiting is recorded in `stats()`.
+    """
+
+    def __init__(self, connect, max_size, timeout):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if not self._idle and self._size >= self.max_size:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            'No connection available within %ss' % self.timeout)
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._size += 1
+            self.record_wait(time.monotonic() - start)
+
+        if conn is None:
+            try:
+                conn = self.connect()
+            except Exception:
+                self.discard(None)
+                raise
+        return conn
+
+    def putconn(self, conn):
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def discard(self, conn):
+        """Close a broken connection and free its slot."""
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def record_wait(self, seconds):
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
@@ -0,0 +1,96 @@
+"""PostgreSQL backend with connection health checks and an optional pool.
+
+Extra DATABASES settings:
+
+    CONN_HEALTH_CHECKS: run `SELECT 1` on a reused connection the first time
+        it is used in each request, and reconnect if that fails.
+    POOL_SIZE: when above 0, connections are taken from and returned to an
+        in-process pool of at most this many connections shared by all
+        threads instead of being opened and closed.
+    POOL_TIMEOUT: seconds to wait for a pooled connection.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from ..pool import ConnectionPool
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool_stats():
+    """Stats of every pool in this process, keyed by database alias."""
+    return {alias: pool.stats() for (alias, pool) in pools.items()}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE') or 0
+        if size <= 0:
+            return None
+        with pools_lock:
+            if self.alias not in pools:
+                pools[self.alias] = ConnectionPool(
+                    self.connect_to_database, size,
+                    self.settings_dict.get('POOL_TIMEOUT', 10))
+            return pools[self.alias]
+
+    def connect_to_database(self):
+        return super().get_new_connection(self.get_connection_params())
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        connection = pool.getconn()
+        # Django expects a fresh connection's isolation level here.
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def connect(self):
+        super().connect()
+        # Fresh connections are healthy, pooled ones may have died while idle.
+        self.health_check_done = self.pool is None
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        connection = self.connection
+        if connection.closed or self.errors_occurred:
+            pool.discard(connection)
+            return
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            pool.discard(connection)
+        else:
+            pool.putconn(connection)
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Called when each request starts and finishes.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
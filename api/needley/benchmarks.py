@@ -0,0 +1,129 @@
+"""Seed data and the query catalog shared by the benchmark commands."""
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from graphql_relay import to_global_id
+
+from . import stats
+from .content import make_excerpt
+from .models import Article
+
+User = get_user_model()
+
+WORDS = (
+    'django react graphql portfolio idea share needle python postgres index '
+    'search query cursor page feed author title content article user profile '
+    'cache worker queue deploy docker test schema model view token session'
+).split()
+
+PASSWORD = 'benchmark-password'
+
+# Seeded users are named bench0, bench1, ...; real users may share the
+# prefix (e.g. "benchmark").
+USERNAME_PREFIX = 'bench'
+
+
+def bench_users():
+    return User.objects.filter(username__regex=r'^%s[0-9]+$' % USERNAME_PREFIX)
+
+
+def sentence(length):
+    return ' '.join(random.choices(WORDS, k=length))
+
+
+def seed(users, articles, batch_size=5000, progress=None):
+    """Top up the tables to at least `users` benchmark users and `articles` articles."""
+    password = make_password(PASSWORD)
+    indexes = [int(username[len(USERNAME_PREFIX):])
+               for username in bench_users().values_list('username', flat=True)]
+    (existing, next_index) = (len(indexes), max(indexes, default=-1) + 1)
+    while existing < users:
+        count = min(batch_size, users - existing)
+        User.objects.bulk_create([
+            User(username='%s%d' % (USERNAME_PREFIX, idx),
+                 email='%s%d@example.com' % (USERNAME_PREFIX, idx),
+                 nickname='%s%d' % (USERNAME_PREFIX, idx), password=password)
+            for idx in range(next_index, next_index + count)
+        ])
+        (existing, next_index) = (existing + count, next_index + count)
+        if progress:
+            progress('users', existing, users)
+
+    author_ids = list(bench_users().values_list('id', flat=True)[:users or 1])
+    existing = Article.objects.count()
+    for start in range(existing, articles, batch_size):
+        contents = [sentence(80)
+                    for _ in range(start, min(start + batch_size, articles))]
+        Article.objects.bulk_create([
+            Article(author_id=random.choice(author_ids), title=sentence(4),
+                    content=content, excerpt=make_excerpt(content))
+            for content in contents
+        ])
+        if progress:
+            progress('articles', min(start + batch_size, articles), articles)
+    if articles > existing:
+        # bulk_create skips the signals that maintain these.
+        stats.recompute(author_ids)
+
+
+def catalog():
+    """Return `(name, query, variables, login)` of every benchmarked operation."""
+    article = Article.objects.order_by('id').first()
+    author_id = to_global_id('UserNode', article.author_id)
+    article_id = to_global_id('ArticleNode', article.id)
+    feed = '''
+        query ($first: Int, $after: String) {
+            recentArticles(first: $first, after: $after) {
+                edges { node { title createdAt author { nickname avatar } } }
+                pageInfo { endCursor hasNextPage }
+            }
+        }
+    '''
+    return [
+        ('allArticles', '''
+            query ($first: Int) {
+                allArticles(first: $first) {
+                    edges { node { title createdAt author { nickname } } }
+                }
+            }
+         ''', {'first': 20}, False),
+        ('allArticles(author)', '''
+            query ($author: ID, $first: Int) {
+                allArticles(author: $author, first: $first) {
+                    edges { node { title content } }
+                }
+            }
+         ''', {'author': author_id, 'first': 20}, False),
+        ('allArticles(excerpt)', '''
+            query ($first: Int) {
+                allArticles(first: $first) {
+                    edges { node { title excerpt(length: 140) } }
+                }
+            }
+         ''', {'first': 20}, False),
+        ('recentArticles', feed, {'first': 20}, False),
+        ('article', '''
+            query ($id: ID!) {
+                article(id: $id) { title content author { nickname } }
+            }
+         ''', {'id': article_id}, False),
+        ('allUsers', '''
+            query ($first: Int) {
+                allUsers(first: $first) { edges { node { username nickname } } }
+            }
+         ''', {'first': 20}, False),
+        ('searchArticles', '''
+            query ($query: String!) {
+                searchArticles(query: $query, first: 20) { edges { node { title } } }
+            }
+         ''', {'query': 'graphql'}, False),
+        ('me', '{ me { user { username nickname } ok } }', None, True),
+        ('postArticle', '''
+            mutation ($title: String!, $content: String!) {
+                postArticle(input: {title: $title, content: $content}) {
+                    article { id }
+                }
+            }
+         ''', {'title': 'benchmark', 'content': sentence(80)}, True),
+    ]
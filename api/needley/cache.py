@@ -0,0 +1,183 @@
+"""Whole-response cache for anonymous GraphQL queries.
+
+Responses are keyed by the normalized query document, the operation name,
+the variables and the current version of every model the document can
+read. Saving or deleting a row of a model replaces that model's version,
+so later lookups miss and stale entries simply age out of the backend.
+
+`get_etag` derives an HTTP entity tag from the same document, plus the
+TableVersion counter of every model read, so that clients and proxies can
+revalidate GET responses without the query being executed again. The
+counters are bumped by database triggers (migration 0008), so they follow
+every write, from any process, and checking them is a single primary key
+lookup.
+"""
+import hashlib
+import json
+import uuid
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from graphene import relay
+from graphene_django import DjangoObjectType
+from graphql import (GraphQLError, OperationType, TypeInfo, TypeInfoVisitor,
+                     Visitor, get_named_type, get_operation_ast, print_ast,
+                     visit)
+
+from .documents import get_document
+from .models import Article, TableVersion
+
+User = get_user_model()
+
+VERSION_KEY = 'graphql-version:%s'
+RESPONSE_KEY = 'graphql-response:%s'
+
+
+def get_cache():
+    alias = getattr(settings, 'GRAPHQL_RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+class QueryInspector(Visitor):
+    """Collect the models a document reads and whether it selects `me`."""
+
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.models = set()
+        self.selects_me = False
+
+    def enter_field(self, node, *args):
+        parent_type = self.type_info.get_parent_type()
+        if parent_type is not None and parent_type.name == 'Query' and node.name.value == 'me':
+            self.selects_me = True
+
+        named_type = get_named_type(self.type_info.get_type())
+        graphene_type = getattr(named_type, 'graphene_type', None)
+        if not isinstance(graphene_type, type):
+            return
+        if issubclass(graphene_type, relay.Connection):
+            graphene_type = graphene_type._meta.node
+        if issubclass(graphene_type, DjangoObjectType):
+            self.models.add(model_label(graphene_type._meta.model))
+
+
+@lru_cache(maxsize=512)
+def inspect_query(schema, query, operation_name):
+    """Return `(normalized document, model labels)`, or None if not cacheable."""
+    try:
+        document, errors = get_document(schema, query)
+    except GraphQLError:
+        return None
+    if errors:
+        return None
+
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+
+    type_info = TypeInfo(schema)
+    inspector = QueryInspector(type_info)
+    visit(document, TypeInfoVisitor(type_info, inspector))
+    if inspector.selects_me:
+        return None
+
+    return (print_ast(document), tuple(sorted(inspector.models)))
+
+
+def get_versions(cache, labels):
+    keys = {VERSION_KEY % label: label for label in labels}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A fresh random version never matches an entry stored before
+            # the previous one was evicted.
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in sorted(keys)]
+
+
+def get_key(schema, query, variables, operation_name):
+    """Return the cache key for a request, or None if it must not be cached."""
+    cache = get_cache()
+    if cache is None or not query:
+        return None
+
+    inspected = inspect_query(schema, query, operation_name)
+    if inspected is None:
+        return None
+    (document, labels) = inspected
+
+    payload = json.dumps([document, operation_name, variables, get_versions(cache, labels)],
+                         sort_keys=True, default=str)
+    return RESPONSE_KEY % hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_etag(schema, query, variables, operation_name):
+    """Return a strong ETag for the response to a query, or None.
+
+    The tag changes whenever a table read by the document is written.
+    Documents reading a model whose table has no TableVersion counter get
+    no tag.
+    """
+    if not query:
+        return None
+    inspected = inspect_query(schema, query, operation_name)
+    if inspected is None:
+        return None
+    (document, labels) = inspected
+
+    tables = [apps.get_model(label)._meta.db_table for label in labels]
+    versions = dict(TableVersion.objects.filter(
+        name__in=tables).values_list('name', 'version'))
+    if len(versions) < len(tables):
+        return None
+
+    payload = json.dumps([document, operation_name, variables,
+                          [versions[table] for table in tables]], sort_keys=True)
+    return '"%s"' % hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_response(key):
+    return get_cache().get(key)
+
+
+def set_response(key, response):
+    get_cache().set(key, response)
+
+
+def invalidate(*models, using=None):
+    cache = get_cache()
+    if cache is None:
+        return
+
+    def bump():
+        cache.set_many({VERSION_KEY % model_label(model): uuid.uuid4().hex
+                        for model in models}, timeout=None)
+
+    # Bump now so this transaction never reads its own stale entries, and
+    # again after the write on database `using` commits in case another
+    # request cached the old rows in between.
+    bump()
+    transaction.on_commit(bump, using=using)
+
+
+def invalidate_on_write(sender, **kwargs):
+    invalidate(sender)
+
+
+def connect_signals():
+    for model in (User, Article):
+        post_save.connect(invalidate_on_write, sender=model,
+                          dispatch_uid='graphql-cache-save-%s' % model_label(model))
+        post_delete.connect(invalidate_on_write, sender=model,
+                            dispatch_uid='graphql-cache-delete-%s' % model_label(model))
@@ -0,0 +1,161 @@
+"""Article excerpts and compressed article bodies.
+
+Every article stores a plain text `excerpt` of its content, computed when
+it is saved, so that feeds can show a preview without reading the whole
+body. `ArticleNode.excerpt(length:)` shortens it further on request.
+
+With ARTICLE_CONTENT_STORAGE = 'compressed', bodies of newly saved articles
+are kept zlib-compressed in the ArticleContent side table and the
+`content` column is left empty; the body is read and decompressed only
+when `content` is selected. Filters on `content` only see bodies stored
+inline; full text search indexes the excerpt of compressed articles.
+`manage.py backfill_articles` recomputes excerpts and moves existing
+bodies between the two storages.
+"""
+import re
+import zlib
+
+from django.conf import settings
+from django.db.models.signals import post_save, pre_save
+
+from . import cache
+from .models import EXCERPT_LENGTH, Article, ArticleContent
+
+INLINE = 'inline'
+COMPRESSED = 'compressed'
+STORAGES = (INLINE, COMPRESSED)
+
+ZLIB = 'zlib'
+
+_whitespace = re.compile(r'\s+')
+
+
+def make_excerpt(content, length=EXCERPT_LENGTH):
+    """Return the start of `content` as one line of at most `length` characters.
+
+    Text cut short ends on a word boundary (if there is one) followed by an
+    ellipsis.
+    """
+    text = _whitespace.sub(' ', content).strip()
+    if len(text) <= length:
+        return text
+    cut = text[:length - 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '…'
+
+
+def get_storage():
+    storage = getattr(settings, 'ARTICLE_CONTENT_STORAGE', INLINE)
+    if storage not in STORAGES:
+        raise Exception('Unknown article content storage: %s' % storage)
+    return storage
+
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'),
+                         getattr(settings, 'ARTICLE_CONTENT_COMPRESSION_LEVEL', 6))
+
+
+def decompress(data, codec=ZLIB):
+    if codec != ZLIB:
+        raise Exception('Unknown article content codec: %s' % codec)
+    return zlib.decompress(data).decode('utf-8')
+
+
+def load_contents(article_ids):
+    """Return the decompressed bodies of the given articles (None if inline)."""
+    rows = ArticleContent.objects.filter(article_id__in=article_ids)
+    contents = {row.article_id: decompress(bytes(row.data), row.codec) for row in rows}
+    return [contents.get(id) for id in article_ids]
+
+
+def backfill(article_ids, storage=None):
+    """Recompute the excerpts of the given articles and move their bodies to
+    `storage` (ARTICLE_CONTENT_STORAGE by default).
+
+    Returns the number of articles that changed.
+    """
+    storage = storage or get_storage()
+    articles = list(Article.objects.filter(
+        id__in=article_ids).only('content', 'excerpt'))
+    compressed = dict(zip(article_ids, load_contents(article_ids)))
+
+    changed = []
+    stored = []
+    for article in articles:
+        body = compressed[article.id]
+        if body is None:
+            body = article.content
+        (content, excerpt) = (article.content, make_excerpt(body))
+        if storage == COMPRESSED and article.content:
+            stored.append(ArticleContent(
+                article_id=article.id, data=compress(body), codec=ZLIB))
+            content = ''
+        elif storage == INLINE and compressed[article.id] is not None:
+            content = body
+        if (content, excerpt) != (article.content, article.excerpt):
+            article.content = content
+            article.excerpt = excerpt
+            changed.append(article)
+
+    if stored:
+        ArticleContent.objects.filter(
+            article_id__in=[row.article_id for row in stored]).delete()
+        ArticleContent.objects.bulk_create(stored)
+    if storage == INLINE:
+        ArticleContent.objects.filter(article_id__in=[
+            id for (id, body) in compressed.items() if body is not None]).delete()
+    if changed:
+        # bulk_update skips the signals, so updated_at is left alone.
+        Article.objects.bulk_update(changed, ['content', 'excerpt'])
+        cache.invalidate(Article)
+    return len(changed)
+
+
+def prepare(article):
+    """Set the excerpt of `article` and, with compressed storage, set its body
+    aside to be stored by `store` once the article has an id."""
+    article.excerpt = make_excerpt(article.content)
+    if get_storage() == COMPRESSED:
+        article._compressed_content = article.content
+        article.content = ''
+
+
+def store(articles):
+    """Store the bodies set aside by `prepare` for articles just saved."""
+    rows = []
+    for article in articles:
+        body = article.__dict__.pop('_compressed_content', None)
+        if body is not None:
+            rows.append(ArticleContent(
+                article_id=article.pk, data=compress(body), codec=ZLIB))
+            # Callers keep working with the body they saved (e.g. to publish it).
+            article.content = body
+    ArticleContent.objects.bulk_create(rows)
+
+
+def prepare_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and 'content' not in update_fields):
+        return
+    if not instance.content and instance.pk is not None:
+        # A compressed article saved without loading its body (e.g. a title
+        # edit); its excerpt and body are unchanged.
+        return
+    prepare(instance)
+
+
+def store_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created and (instance.content or '_compressed_content' in instance.__dict__):
+        # Replace (or, when now stored inline, drop) a body compressed earlier.
+        ArticleContent.objects.filter(article_id=instance.pk).delete()
+    store([instance])
+
+
+def connect_signals():
+    pre_save.connect(prepare_on_save, sender=Article,
+                     dispatch_uid='article-content-prepare')
+    post_save.connect(store_on_save, sender=Article,
+                      dispatch_uid='article-content-store')
@@ -0,0 +1,125 @@
+"""Static cost analysis of GraphQL operations.
+
+Every field returning an object costs 1 and scalars are free. A field that
+pages a connection multiplies the cost of its selections by the page size it
+asks for (`first`/`last`, or the connection limit when neither is given).
+Introspection fields are not counted.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (FieldNode, FragmentDefinitionNode, FragmentSpreadNode,
+                     GraphQLError, InlineFragmentNode, get_named_type,
+                     get_operation_ast, is_leaf_type)
+from graphql.execution.values import get_argument_values
+
+# Extra cost of resolving a field once, by "Type.field"
+FIELD_COSTS = {
+    'Query.searchArticles': 10,
+}
+
+
+@dataclass
+class QueryCost:
+    cost: int
+    depth: int
+
+    def as_extension(self):
+        return {
+            'requested': self.cost,
+            'depth': self.depth,
+            'maximum': getattr(settings, 'GRAPHQL_MAX_QUERY_COST', None),
+        }
+
+
+def analyze(schema, document, operation_name=None, variables=None):
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return QueryCost(cost=0, depth=0)
+
+    root_type = schema.get_root_type(operation.operation)
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    analyzer = Analyzer(schema, fragments, variables or {})
+    (cost, depth) = analyzer.selection_set_cost(
+        operation.selection_set, root_type)
+    return QueryCost(cost=cost, depth=depth)
+
+
+def check_limits(query_cost):
+    errors = []
+    max_depth = getattr(settings, 'GRAPHQL_MAX_QUERY_DEPTH', None)
+    if max_depth is not None and query_cost.depth > max_depth:
+        errors.append(GraphQLError(
+            'Query depth %d exceeds the maximum depth of %d.' % (query_cost.depth, max_depth)))
+
+    max_cost = getattr(settings, 'GRAPHQL_MAX_QUERY_COST', None)
+    if max_cost is not None and query_cost.cost > max_cost:
+        errors.append(GraphQLError(
+            'Query cost %d exceeds the maximum cost of %d.' % (query_cost.cost, max_cost)))
+    return errors
+
+
+class Analyzer:
+    def __init__(self, schema, fragments, variables):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables
+
+    def selection_set_cost(self, selection_set, parent_type):
+        """Return `(cost, depth)` of the selections made on `parent_type`."""
+        cost = depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                (field_cost, field_depth) = self.field_cost(
+                    selection, parent_type)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.schema.get_type(
+                        selection.type_condition.name.value)
+                (field_cost, field_depth) = self.selection_set_cost(
+                    selection.selection_set, fragment_type)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments[selection.name.value]
+                (field_cost, field_depth) = self.selection_set_cost(
+                    fragment.selection_set, self.schema.get_type(fragment.type_condition.name.value))
+            else:
+                continue
+            cost += field_cost
+            depth = max(depth, field_depth)
+        return (cost, depth)
+
+    def field_cost(self, node, parent_type):
+        name = node.name.value
+        if name.startswith('__'):
+            return (0, 0)
+
+        field = parent_type.fields[name]
+        field_type = get_named_type(field.type)
+        if is_leaf_type(field_type) or node.selection_set is None:
+            return (0, 1)
+
+        (children_cost, children_depth) = self.selection_set_cost(
+            node.selection_set, field_type)
+        own_cost = 1 + FIELD_COSTS.get('%s.%s' % (parent_type.name, name), 0)
+        return (own_cost + self.page_size(field, node) * children_cost, children_depth + 1)
+
+    def page_size(self, field, node):
+        if 'first' not in field.args and 'last' not in field.args:
+            return 1
+        try:
+            args = get_argument_values(field, node, self.variables)
+        except GraphQLError:
+            # Invalid variables are reported when the operation executes.
+            args = {}
+        for name in ('first', 'last'):
+            if args.get(name) is not None:
+                # Negative sizes are rejected on execution; never let them
+                # take cost off sibling fields.
+                return max(args[name], 0)
+        return graphene_settings.RELAY_CONNECTION_MAX_LIMIT
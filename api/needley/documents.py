@@ -0,0 +1,22 @@
+from functools import lru_cache
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import parse, validate
+
+
+def get_document(schema, query, validation_rules=None):
+    """Parse and validate a query document, memoized per process.
+
+    Returns `(document, validation_errors)`. Syntax errors are raised as
+    `GraphQLError` and not cached.
+    """
+    return _get_document(schema, query, validation_rules)
+
+
+@lru_cache(maxsize=getattr(settings, 'GRAPHQL_DOCUMENT_CACHE_SIZE', 1000))
+def _get_document(schema, query, validation_rules):
+    document = parse(query)
+    errors = validate(schema, document, validation_rules,
+                      graphene_settings.MAX_VALIDATION_ERRORS)
+    return (document, tuple(errors))
@@ -0,0 +1,134 @@
+"""JSON serialization and compression of GraphQL responses.
+
+`dumps(obj)` serializes with the function named by GRAPHQL_JSON_SERIALIZER
+and returns UTF-8 bytes. The default, `fast_dumps`, uses orjson when it is
+installed and falls back to the standard library otherwise; both produce
+the same compact JSON for GraphQL results.
+
+`CompressionMiddleware` compresses responses of at least
+COMPRESSION_MIN_SIZE bytes with the best encoding the client accepts:
+brotli (when the `brotli` package is installed) or gzip. Like Django's
+GZipMiddleware, it weakens the ETag of responses it compresses, since the
+bytes differ from the uncompressed representation.
+"""
+import asyncio
+import gzip
+import json
+import re
+from functools import lru_cache
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def orjson_dumps(obj):
+    return orjson.dumps(obj)
+
+
+fast_dumps = orjson_dumps if orjson is not None else stdlib_dumps
+
+
+@lru_cache(maxsize=None)
+def get_serializer(path):
+    return import_string(path)
+
+
+def dumps(obj):
+    return get_serializer(getattr(
+        settings, 'GRAPHQL_JSON_SERIALIZER', 'needley.encoding.fast_dumps'))(obj)
+
+
+def compress(data, encoding):
+    levels = getattr(settings, 'COMPRESSION_LEVELS', {})
+    if encoding == 'br':
+        return brotli.compress(data, quality=levels.get('br', 4))
+    # mtime=0 keeps the output (and so any cache keyed on it) deterministic.
+    return gzip.compress(data, compresslevel=levels.get('gzip', 6), mtime=0)
+
+
+def available_encodings():
+    """Encodings this server can produce, preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+_accept_encoding = re.compile(r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def negotiate(accept_encoding):
+    """Return the encoding to use for an Accept-Encoding header, or None."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        match = _accept_encoding.match(item)
+        if match is None:
+            continue
+        try:
+            quality = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        qualities[match.group(1).lower()] = quality
+
+    default = qualities.get('*', 0)
+    best = None
+    for encoding in available_encodings():
+        quality = qualities.get(encoding, default)
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best and best[0]
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress_response(request, await self.get_response(request))
+
+    def compress_response(self, request, response):
+        # Streaming responses (e.g. the article export) compress themselves.
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
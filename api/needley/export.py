@@ -0,0 +1,104 @@
+"""Streaming export of articles joined with their authors.
+
+Rows are read in checkpoint order, `(created_at, id)` ascending, through
+`QuerySet.iterator()` (a server-side cursor on PostgreSQL), and encoded a
+chunk at a time, so memory use does not grow with the table. Every record
+carries its own `created_at` and `id`, which is the checkpoint to resume
+from after an interrupted export.
+"""
+import csv
+import io
+import json
+import zlib
+
+from django.utils.dateparse import parse_datetime
+
+from . import content
+from .fields import seek_predicate
+from .models import Article
+
+FIELDS = ('id', 'title', 'content', 'created_at', 'updated_at',
+          'author_id', 'author__username', 'author__nickname')
+# Column names as written to the export.
+COLUMNS = [field.replace('__', '_') for field in FIELDS]
+# Bodies stored compressed (see needley/content.py) replace `content`.
+BODY_FIELDS = ('compressed_content__codec', 'compressed_content__data')
+ORDERING = ('created_at', 'id')
+FORMATS = ('jsonl', 'csv')
+
+CHUNK_SIZE = 2000
+
+
+def parse_checkpoint(value):
+    """Parse a `<created_at>,<id>` checkpoint as written by `format_checkpoint`."""
+    try:
+        created_at, id = value.rsplit(',', 1)
+        checkpoint = (parse_datetime(created_at), int(id))
+    except ValueError:
+        checkpoint = (None, None)
+    if checkpoint[0] is None:
+        raise Exception('Invalid checkpoint: %s' % value)
+    return checkpoint
+
+
+def format_checkpoint(created_at, id):
+    return '%s,%d' % (created_at.isoformat(), id)
+
+
+def export_rows(after=None, chunk_size=CHUNK_SIZE):
+    """Yield article rows as dicts, starting strictly after the `after` checkpoint."""
+    queryset = Article.objects.order_by(*ORDERING)
+    if after is not None:
+        queryset = queryset.filter(seek_predicate(ORDERING, after))
+
+    rows = queryset.values_list(*FIELDS, *BODY_FIELDS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        record = dict(zip(COLUMNS, row))
+        (codec, data) = row[len(FIELDS):]
+        if data is not None:
+            record['content'] = content.decompress(bytes(data), codec)
+        yield record
+
+
+def encode(rows, format='jsonl', chunk_size=CHUNK_SIZE, header=True):
+    """Encode rows as JSON lines or CSV, yielding strings of up to `chunk_size` rows.
+
+    `header=False` leaves out the CSV header, for appending to an export.
+    """
+    if format not in FORMATS:
+        raise Exception('Unknown export format: %s' % format)
+
+    buffer = io.StringIO()
+    if format == 'csv':
+        writer = csv.DictWriter(buffer, COLUMNS)
+        if header:
+            writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(row, default=str, ensure_ascii=False))
+            buffer.write('\n')
+
+    count = 0
+    for row in rows:
+        row['created_at'] = row['created_at'].isoformat()
+        row['updated_at'] = row['updated_at'].isoformat()
+        write(row)
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of strings into a single gzip member."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,187 @@
+import json
+
+import graphene
+from django.db.models import Q
+from graphene import relay
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.settings import graphene_settings
+from graphql_relay.utils import base64, unbase64
+from promise import Promise
+
+from .projection import add_columns
+
+KEYSET_CURSOR_PREFIX = 'keyset:'
+
+
+class CountableConnection(relay.Connection):
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        # Offset pagination has already counted the rows; keyset pagination
+        # only counts them when a client actually asks for it.
+        length = getattr(root, 'length', None)
+        if length is None:
+            length = root.length = root.iterable.count()
+        return length
+
+
+class BatchedConnectionField(DjangoFilterConnectionField):
+    """Connection field that lets its node type batch-load relations.
+
+    Once a page has been sliced, the node type's `batch_load(info, nodes)`
+    hook (if any) is called with every node on it, so loaders can fetch the
+    related rows for the whole page in one query.
+    """
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        resolved = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args)
+
+        batch_load = getattr(connection._meta.node, 'batch_load', None)
+        if batch_load is None:
+            return resolved
+
+        def on_resolve(connection):
+            batch_load(info, [edge.node for edge in connection.edges])
+            return connection
+
+        if Promise.is_thenable(resolved):
+            return Promise.resolve(resolved).then(on_resolve)
+
+        return on_resolve(resolved)
+
+
+class KeysetConnectionField(BatchedConnectionField):
+    """Connection field paginated by seeking on a unique sort key.
+
+    Cursors encode the sort key values of an edge (e.g. `(created_at, id)`),
+    and pages are fetched with range predicates on those columns instead of
+    `OFFSET`, so every page costs the same regardless of depth. Rows are not
+    counted unless `totalCount` is selected.
+    """
+
+    def __init__(self, type_, ordering=('-created_at', '-id'), *args, **kwargs):
+        # The last key must be unique so that every row has a distinct cursor.
+        self.ordering = tuple(ordering)
+        super().__init__(type_, *args, **kwargs)
+
+    @property
+    def args(self):
+        args = super().args
+        args.pop('offset', None)
+        return args
+
+    @args.setter
+    def args(self, args):
+        self._base_args = args
+
+    def get_queryset_resolver(self):
+        resolve_queryset = super().get_queryset_resolver()
+
+        def resolver(connection, iterable, info, args):
+            queryset = resolve_queryset(connection, iterable, info, args)
+            # Cursors are built from the ordering columns.
+            queryset = add_columns(
+                queryset, [key.lstrip('-') for key in self.ordering])
+            return queryset.order_by(*self.ordering)
+
+        return resolver
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        ordering = iterable.query.order_by
+        first = args.get('first')
+        last = args.get('last')
+        after = args.get('after')
+        before = args.get('before')
+
+        if first is None and last is None:
+            first = max_limit or graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+        queryset = iterable
+        if after:
+            queryset = queryset.filter(
+                seek_predicate(ordering, decode_cursor(iterable.model, ordering, after)))
+        if before:
+            queryset = queryset.filter(
+                seek_predicate(reverse_ordering(ordering), decode_cursor(iterable.model, ordering, before)))
+
+        has_previous_page = has_next_page = False
+        if first is not None:
+            nodes = list(queryset[:first + 1])
+            has_next_page = len(nodes) > first
+            nodes = nodes[:first]
+            if last is not None and len(nodes) > last:
+                nodes = nodes[-last:]
+                has_previous_page = True
+        else:
+            nodes = list(queryset.order_by(*reverse_ordering(ordering))[:last + 1])
+            has_previous_page = len(nodes) > last
+            nodes = nodes[:last][::-1]
+
+        edges = [
+            connection.Edge(node=node, cursor=encode_cursor(node, ordering))
+            for node in nodes
+        ]
+        page_info = relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page,
+        )
+
+        resolved = connection(edges=edges, page_info=page_info)
+        resolved.iterable = iterable
+        return resolved
+
+
+def reverse_ordering(ordering):
+    return tuple(key[1:] if key.startswith('-') else '-' + key for key in ordering)
+
+
+def seek_predicate(ordering, values):
+    """Match the rows that come strictly after `values` in `ordering`.
+
+    For `('-created_at', '-id')` this is `created_at <= c AND (created_at < c
+    OR id < i)`, which keeps a plain range condition on the leading column so
+    the database can seek on its index.
+    """
+    names = [key.lstrip('-') for key in ordering]
+    lookups = ['lt' if key.startswith('-') else 'gt' for key in ordering]
+
+    after = Q(**{f'{names[-1]}__{lookups[-1]}': values[-1]})
+    for idx in reversed(range(len(names) - 1)):
+        strictly = Q(**{f'{names[idx]}__{lookups[idx]}': values[idx]})
+        after = strictly | (Q(**{names[idx]: values[idx]}) & after)
+
+    leading = f'{names[0]}__{lookups[0]}e'
+    return Q(**{leading: values[0]}) & after
+
+
+def encode_cursor(node, ordering):
+    # Keep full precision: a truncated timestamp would skip or repeat rows.
+    values = [getattr(node, key.lstrip('-')) for key in ordering]
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value
+              for value in values]
+    return base64(KEYSET_CURSOR_PREFIX + json.dumps(values))
+
+
+def decode_cursor(model, ordering, cursor):
+    payload = unbase64(cursor)
+    if not payload.startswith(KEYSET_CURSOR_PREFIX):
+        raise Exception('Invalid cursor: %s' % cursor)
+    try:
+        values = json.loads(payload[len(KEYSET_CURSOR_PREFIX):])
+    except ValueError:
+        raise Exception('Invalid cursor: %s' % cursor)
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise Exception('Invalid cursor: %s' % cursor)
+
+    fields = [model._meta.get_field(key.lstrip('-')) for key in ordering]
+    return [field.to_python(value) for (field, value) in zip(fields, values)]
@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+
+from .content import load_contents
+
+User = get_user_model()
+
+
+class DataLoader:
+    """Request-scoped cache that batches lookups by key.
+
+    Keys given to `enqueue` are not fetched right away. They are fetched
+    together with the first `load` that misses the cache, so resolving a
+    relation for a whole page of nodes costs a single query.
+    """
+
+    def __init__(self, batch_load_fn):
+        # batch_load_fn takes a list of keys and returns values in the same order
+        self.batch_load_fn = batch_load_fn
+        self._cache = {}
+        self._queue = set()
+
+    def enqueue(self, keys):
+        self._queue.update(key for key in keys if key not in self._cache)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._queue.add(key)
+            self.dispatch()
+        return self._cache.get(key)
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.enqueue(keys)
+        return [self.load(key) for key in keys]
+
+    def prime(self, key, value):
+        self._cache.setdefault(key, value)
+
+    def clear(self, key):
+        self._cache.pop(key, None)
+
+    def dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        if not keys:
+            return
+        self._cache.update(zip(keys, self.batch_load_fn(keys)))
+
+
+def load_users(ids):
+    users = User.objects.in_bulk(ids)
+    return [users.get(id) for id in ids]
+
+
+class Loaders:
+    """All loaders available to resolvers during one request."""
+
+    def __init__(self):
+        self.users = DataLoader(load_users)
+        self.contents = DataLoader(load_contents)
+
+
+def get_loaders(info):
+    # The view attaches loaders to each request; fall back to creating them
+    # lazily for contexts that did not go through it (e.g. graphene.test).
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = context.loaders = Loaders()
+    return loaders
@@ -0,0 +1,36 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from needley import content
+from needley.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Recompute article excerpts and move article bodies to the configured content storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--storage', choices=content.STORAGES,
+            help='Move bodies to this storage instead of ARTICLE_CONTENT_STORAGE.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Articles updated per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        storage = options['storage'] or content.get_storage()
+        ids = Article.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+        checked = changed = 0
+        while True:
+            batch = list(itertools.islice(ids, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                changed += content.backfill(batch, storage)
+            checked += len(batch)
+        self.stdout.write('Checked %d articles, updated %d (%s storage)' % (
+            checked, changed, storage))
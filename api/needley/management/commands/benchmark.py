@@ -0,0 +1,124 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from needley.benchmarks import bench_users, catalog, seed
+
+
+class Command(BaseCommand):
+    help = 'Seed data and report latency, SQL queries and allocations of representative GraphQL operations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Seed at least this many users.',
+        )
+        parser.add_argument(
+            '--articles', type=int, default=100000,
+            help='Seed at least this many articles.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Timed runs per operation.',
+        )
+        parser.add_argument(
+            '--only', nargs='*',
+            help='Only run the named operations.',
+        )
+        parser.add_argument(
+            '--response-cache', action='store_true',
+            help='Keep the anonymous response cache enabled.',
+        )
+        parser.add_argument(
+            '--json', dest='json_path',
+            help='Write the results to this file.',
+        )
+        parser.add_argument(
+            '--compare',
+            help='Print the change against results written earlier with --json.',
+        )
+
+    def handle(self, *args, **options):
+        seed(options['users'], options['articles'], progress=self.progress)
+
+        user = bench_users().first()
+        results = {}
+        response_cache = 'graphql' if options['response_cache'] else None
+        with override_settings(GRAPHQL_RESPONSE_CACHE=response_cache,
+                               ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+            for (name, query, variables, login) in catalog():
+                if options['only'] and name not in options['only']:
+                    continue
+                client = Client()
+                if login:
+                    client.force_login(user)
+                results[name] = self.run(
+                    client, query, variables, max(options['repeat'], 2))
+
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)['results']
+
+        self.stdout.write('%-22s %9s %9s %8s %10s' %
+                          ('operation', 'p50 ms', 'p95 ms', 'queries', 'alloc KiB'))
+        for (name, result) in results.items():
+            line = '%-22s %9.2f %9.2f %8d %10.1f' % (
+                name, result['p50_ms'], result['p95_ms'], result['queries'], result['alloc_peak_kib'])
+            if name in previous:
+                line += '  (p50 %+.1f%%)' % (
+                    (result['p50_ms'] / previous[name]['p50_ms'] - 1) * 100)
+            self.stdout.write(line)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({
+                    'vendor': connection.vendor,
+                    'users': options['users'],
+                    'articles': options['articles'],
+                    'repeat': options['repeat'],
+                    'results': results,
+                }, f, indent=2)
+
+    def run(self, client, query, variables, repeat):
+        def request():
+            response = client.post('/graphql', json.dumps({'query': query, 'variables': variables}),
+                                   content_type='application/json')
+            assert 'errors' not in json.loads(response.content), response.content
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        # Warm up, then count queries and allocations outside the timed runs.
+        # (The query log is reset when each request starts, so wrap execution.)
+        request()
+        queries = []
+        with connection.execute_wrapper(count_query):
+            request()
+        tracemalloc.start()
+        request()
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'p50_ms': statistics.median(timings),
+            'p95_ms': statistics.quantiles(timings, n=20)[18],
+            'mean_ms': statistics.mean(timings),
+            'queries': len(queries),
+            'alloc_peak_kib': peak / 1024,
+        }
+
+    def progress(self, table, done, total):
+        self.stdout.write('seeding %s... %d/%d' % (table, done, total))
@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from needley.backends.postgresql.base import get_pool_stats
+from needley.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request database overhead of an article(id:) lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Number of simulated requests per mode.',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to benchmark.',
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+        article_id = Article.objects.using(
+            database).values_list('id', flat=True).first()
+
+        def lookup():
+            Article.objects.using(database).filter(pk=article_id).first()
+
+        # New connection per request, as with CONN_MAX_AGE = 0 and no pool
+        reconnect = self.measure(options['requests'], lookup,
+                                 after=lambda: connections[database].close())
+        # Whatever CONN_MAX_AGE / POOL_SIZE / CONN_HEALTH_CHECKS configure
+        configured = self.measure(options['requests'], lookup)
+
+        settings_dict = connections[database].settings_dict
+        self.stdout.write('CONN_MAX_AGE=%s POOL_SIZE=%s CONN_HEALTH_CHECKS=%s' % (
+            settings_dict.get('CONN_MAX_AGE'), settings_dict.get('POOL_SIZE'),
+            settings_dict.get('CONN_HEALTH_CHECKS')))
+        for (name, timings) in (('reconnect', reconnect), ('configured', configured)):
+            quantiles = statistics.quantiles(timings, n=100)
+            self.stdout.write('%-10s mean=%.3fms p50=%.3fms p95=%.3fms' % (
+                name, statistics.mean(timings), quantiles[49], quantiles[94]))
+        for (alias, stats) in get_pool_stats().items():
+            self.stdout.write('pool %s: %s' % (alias, stats))
+
+    def measure(self, requests, func, after=None):
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            # The signals run Django's per-request connection handling.
+            request_started.send(sender=self.__class__)
+            func()
+            request_finished.send(sender=self.__class__)
+            if after:
+                after()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
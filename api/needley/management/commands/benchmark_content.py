@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from needley import content
+from needley.benchmarks import seed
+from needley.models import Article, ArticleContent
+
+
+class Command(BaseCommand):
+    help = '''Report the size of article bodies inline and compressed, and the
+    time to read a page of excerpts or bodies. Run it before and after
+    `backfill_articles --storage compressed` to compare the two storages.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--articles', type=int, default=100000,
+            help='Seed articles until the table holds at least this many rows.',
+        )
+        parser.add_argument(
+            '--sample', type=int, default=1000,
+            help='Articles compressed and decompressed to time the codec.',
+        )
+        parser.add_argument(
+            '--page-size', type=int, default=20,
+            help='Articles read per page.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Number of timed runs per measurement.',
+        )
+
+    def handle(self, *args, **options):
+        seed(1, options['articles'])
+        compressed = ArticleContent.objects.count()
+        self.stdout.write('%s: %d articles, %d stored compressed' % (
+            connection.vendor, Article.objects.count(), compressed))
+
+        ids = list(Article.objects.order_by('id').values_list(
+            'id', flat=True)[:options['sample']])
+        bodies = self.read_bodies(ids)
+        raw = [body.encode('utf-8') for body in bodies]
+        packed = [content.compress(body) for body in bodies]
+        self.stdout.write('bodies: %.1f KiB inline, %.1f KiB compressed (%.0f%%)' % (
+            sum(map(len, raw)) / 1024, sum(map(len, packed)) / 1024,
+            sum(map(len, packed)) / max(sum(map(len, raw)), 1) * 100))
+
+        per_body = 1000 / max(len(bodies), 1)
+        self.stdout.write('codec: compress %.1fus, decompress %.1fus per body' % (
+            self.measure(lambda: [content.compress(body) for body in bodies], 3) * per_body,
+            self.measure(lambda: [content.decompress(data) for data in packed], 3) * per_body))
+
+        page = list(Article.objects.values_list('id', flat=True)[:options['page_size']])
+        self.stdout.write('page of %d: excerpts p50=%.2fms  bodies p50=%.2fms' % (
+            len(page),
+            self.measure(lambda: list(Article.objects.filter(id__in=page).values_list(
+                'title', 'excerpt')), options['repeat']),
+            self.measure(lambda: self.read_bodies(page), options['repeat'])))
+
+    def read_bodies(self, ids):
+        """Read bodies the way ArticleNode.content does, from either storage."""
+        inline = dict(Article.objects.filter(id__in=ids).values_list('id', 'content'))
+        missing = [id for id in ids if not inline.get(id)]
+        inline.update((id, body) for (id, body) in zip(
+            missing, content.load_contents(missing)) if body is not None)
+        return [inline.get(id, '') for id in ids]
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from needley import encoding
+from needley.benchmarks import seed
+from needley.schema import schema
+
+FEED = '''
+    query ($first: Int) {
+        allArticles(first: $first) {
+            edges { node { id title content createdAt author { nickname avatar } } }
+        }
+    }
+'''
+
+
+class Command(BaseCommand):
+    help = 'Report CPU time and bytes on the wire of serializing and compressing feed pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--articles', type=int, default=1000,
+            help='Seed articles until the table holds at least this many rows.',
+        )
+        parser.add_argument(
+            '--page-size', type=int, nargs='*', default=[20, 100],
+            help='Feed page sizes to measure.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Number of timed runs per measurement.',
+        )
+
+    def handle(self, *args, **options):
+        seed(10, options['articles'])
+
+        serializers = [('json', encoding.stdlib_dumps)]
+        if encoding.orjson is not None:
+            serializers.append(('orjson', encoding.orjson_dumps))
+
+        self.stdout.write('%-6s %-10s %-9s %10s %12s' %
+                          ('page', 'serializer', 'encoding', 'bytes', 'cpu us/resp'))
+        for page_size in options['page_size']:
+            result = schema.execute(FEED, variables={'first': page_size},
+                                    context_value=RequestFactory().get('/graphql'))
+            assert not result.errors, result.errors
+            payload = {'data': result.data}
+
+            for (name, dumps) in serializers:
+                body = dumps(payload)
+                self.report(page_size, name, 'identity', len(body),
+                            self.measure(lambda: dumps(payload), options['repeat']))
+
+            body = encoding.fast_dumps(payload)
+            for content_encoding in encoding.available_encodings():
+                compressed = encoding.compress(body, content_encoding)
+                self.report(page_size, '', content_encoding, len(compressed), self.measure(
+                    lambda: encoding.compress(body, content_encoding), options['repeat']))
+
+    def report(self, page_size, serializer, content_encoding, size, cpu):
+        self.stdout.write('%-6d %-10s %-9s %10d %12.1f' %
+                          (page_size, serializer, content_encoding, size, cpu))
+
+    def measure(self, func, repeat):
+        """Median CPU time of `func` in microseconds."""
+        timings = []
+        for _ in range(repeat):
+            start = time.process_time()
+            func()
+            timings.append((time.process_time() - start) * 1000000)
+        return statistics.median(timings)
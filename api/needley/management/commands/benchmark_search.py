@@ -0,0 +1,52 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from needley.benchmarks import seed
+from needley.models import Article
+from needley.search import search_articles
+
+
+class Command(BaseCommand):
+    help = 'Compare full text search against icontains filters on a seeded article table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--articles', type=int, default=1000000,
+            help='Seed articles until the table holds at least this many rows.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of timed runs per query.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Rows per INSERT while seeding.',
+        )
+        parser.add_argument(
+            'terms', nargs='*', default=['graphql', 'postgres index', 'docker'],
+            help='Search terms to benchmark.',
+        )
+
+    def handle(self, *args, **options):
+        seed(1, options['articles'], options['batch_size'])
+        self.stdout.write('%s: %d articles' %
+                          (connection.vendor, Article.objects.count()))
+
+        for term in options['terms']:
+            searched = self.measure(
+                lambda: list(search_articles(term).values_list('id', flat=True)[:20]), options['repeat'])
+            scanned = self.measure(
+                lambda: list(Article.objects.filter(content__icontains=term).values_list('id', flat=True)[:20]), options['repeat'])
+            self.stdout.write('%-20s searchArticles p50=%.2fms  content_Icontains p50=%.2fms' %
+                              (term, searched, scanned))
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from graphene_django.filter.utils import get_filterset_class
+from graphql_relay import to_global_id
+
+from needley.models import Article
+from needley.schema import ArticleNode
+
+
+class Command(BaseCommand):
+    help = 'Print query plans for every allArticles filter the GraphQL schema exposes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--first', type=int, default=100,
+            help='Page size to plan for.',
+        )
+        parser.add_argument(
+            '--fail-on-seq-scan', action='store_true',
+            help='Exit with an error if any plan scans the whole article table.',
+        )
+
+    def handle(self, *args, **options):
+        sample = Article.objects.order_by('created_at').first()
+        if sample is None:
+            raise CommandError('At least one article is required to pick filter values.')
+
+        filterset_class = get_filterset_class(
+            None, model=Article, fields=ArticleNode._meta.filter_fields)
+        queryset = ArticleNode.get_queryset(Article.objects.all(), None)
+        vendor = connections[queryset.db].vendor
+
+        seq_scans = []
+        for (name, data) in self.combinations(sample):
+            filterset = filterset_class(data=data, queryset=queryset)
+            if not filterset.is_valid():
+                raise CommandError('%s: %s' % (name, filterset.errors.as_json()))
+            page = filterset.qs[:options['first']]
+
+            if vendor == 'postgresql':
+                plan = page.explain(analyze=True, buffers=True)
+            else:
+                plan = page.explain()
+
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            self.stdout.write('')
+            if self.is_full_scan(vendor, plan):
+                seq_scans.append(name)
+
+        if seq_scans:
+            self.stdout.write(self.style.WARNING(
+                'Sequential scans: %s' % ', '.join(seq_scans)))
+            if options['fail_on_seq_scan']:
+                raise CommandError('%d filter(s) scan the whole table' % len(seq_scans))
+
+    def is_full_scan(self, vendor, plan):
+        if vendor == 'postgresql':
+            return 'Seq Scan on needley_article' in plan
+        # SQLite: "SCAN needley_article" without "USING ... INDEX"
+        return any(line.split()[-1] == 'needley_article' and 'SCAN' in line
+                   for line in plan.splitlines() if line.strip())
+
+    def combinations(self, sample):
+        """Yield (name, filter data) for each filter alone and combined with `author`."""
+        values = {
+            'author': to_global_id('UserNode', sample.author_id),
+            'title': sample.title,
+            'title__icontains': sample.title[:3],
+            'content': sample.content,
+            'content__icontains': sample.content[:3],
+        }
+        for field in ('created_at', 'updated_at'):
+            for lookup in ArticleNode._meta.filter_fields[field]:
+                name = field if lookup == 'exact' else '%s__%s' % (field, lookup)
+                values[name] = getattr(sample, field).isoformat()
+
+        yield ('(no filters)', {})
+        for (name, value) in values.items():
+            yield (name, {name: value})
+        for (name, value) in values.items():
+            if name != 'author':
+                yield ('author + %s' % name, {'author': values['author'], name: value})
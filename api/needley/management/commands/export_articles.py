@@ -0,0 +1,61 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from needley.export import (CHUNK_SIZE, FORMATS, encode, export_rows, gzip_chunks,
+                            parse_checkpoint)
+
+
+class Command(BaseCommand):
+    help = '''Stream every article with its author fields as JSON lines or CSV.
+
+    Rows come out in (created_at, id) order. Pass the created_at and id of
+    the last exported row as --after to resume an interrupted export.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='File to write (default: stdout).',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS, default='jsonl',
+            help='Output format.',
+        )
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Compress the output with gzip.',
+        )
+        parser.add_argument(
+            '--after',
+            help='Checkpoint "<created_at>,<id>" to resume after.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Rows fetched from the cursor at a time.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            after = parse_checkpoint(
+                options['after']) if options['after'] else None
+        except Exception as e:
+            raise CommandError(str(e))
+
+        chunks = encode(export_rows(after, options['chunk_size']),
+                        options['format'], options['chunk_size'], header=after is None)
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+        else:
+            chunks = (chunk.encode() for chunk in chunks)
+
+        if options['output'] == '-':
+            self.write(chunks, sys.stdout.buffer)
+        else:
+            # Resumed exports are appended to what was already written.
+            with open(options['output'], 'ab' if after else 'wb') as f:
+                self.write(chunks, f)
+
+    def write(self, chunks, f):
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
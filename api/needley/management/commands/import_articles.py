@@ -0,0 +1,189 @@
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from needley import cache, stats
+from needley.content import make_excerpt
+from needley.models import Article
+
+User = get_user_model()
+
+USER_COLUMNS = ['username', 'email', 'password', 'nickname', 'avatar', 'first_name', 'last_name',
+                'is_superuser', 'is_staff', 'is_active', 'date_joined', 'updated_at',
+                'article_count']
+ARTICLE_COLUMNS = ['author_id', 'title', 'content', 'excerpt', 'created_at', 'updated_at']
+
+
+def hash_password(raw):
+    # Runs in worker processes, so it must stay importable at module level.
+    return make_password(raw)
+
+
+def read_records(path, format):
+    """Yield one dict per JSON line or CSV row without loading the whole file."""
+    f = sys.stdin if path == '-' else open(path, newline='')
+    try:
+        if format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def chunks(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = '''Bulk load users and articles from JSON lines or CSV files.
+
+    User records need username, email, nickname and either password (hashed
+    here) or password_hash. Article records need author (a username), title
+    and content, and may carry created_at/updated_at. On PostgreSQL rows are
+    loaded with COPY and users that already exist are skipped; other databases use
+    bulk_create, which stamps articles with the import time. Bodies are
+    stored inline; run backfill_articles afterwards to compress them.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'articles', nargs='?',
+            help='Article records (.jsonl or .csv, - for stdin).',
+        )
+        parser.add_argument(
+            '--users',
+            help='User records to load before the articles.',
+        )
+        parser.add_argument(
+            '--format', choices=['jsonl', 'csv'],
+            help='Input format; guessed from the file extension by default.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Records loaded per statement.',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Worker processes hashing passwords (default: CPU count).',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to load into.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['users'] and not options['articles']:
+            raise CommandError('Give an article file, --users or both.')
+
+        self.connection = connections[options['database']]
+        self.database = options['database']
+        self.use_copy = self.connection.vendor == 'postgresql'
+
+        if options['users']:
+            with ProcessPoolExecutor(max_workers=options['processes']) as pool:
+                self.load(options['users'], options, 'users',
+                          lambda chunk: self.load_users(chunk, pool))
+        if options['articles']:
+            self.load(options['articles'], options,
+                      'articles', self.load_articles)
+
+        # Bulk loads do not send the signals that normally expire responses.
+        cache.invalidate(User, Article)
+
+    def load(self, path, options, name, load_chunk):
+        format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        start = time.monotonic()
+        total = 0
+        for chunk in chunks(read_records(path, format), options['batch_size']):
+            with transaction.atomic(using=self.database):
+                load_chunk(chunk)
+            total += len(chunk)
+            elapsed = time.monotonic() - start
+            self.stdout.write('%s: %d records (%.0f/s)' %
+                              (name, total, total / elapsed if elapsed else 0))
+
+    def load_users(self, records, pool):
+        raw = [record.get('password') for record in records
+               if not record.get('password_hash')]
+        hashed = iter(pool.map(hash_password, raw, chunksize=64))
+        now = timezone.now()
+
+        rows = []
+        for record in records:
+            password = record.get('password_hash') or next(hashed)
+            rows.append([
+                record['username'], record['email'], password, record['nickname'],
+                record.get('avatar') or None, record.get(
+                    'first_name', ''), record.get('last_name', ''),
+                False, False, True, record.get('date_joined') or now, now, 0,
+            ])
+
+        if self.use_copy:
+            self.copy_rows(User._meta.db_table, USER_COLUMNS,
+                           rows, skip_conflicts=True)
+        else:
+            User.objects.using(self.database).bulk_create(
+                [User(**dict(zip(USER_COLUMNS, row))) for row in rows], ignore_conflicts=True)
+
+    def load_articles(self, records):
+        usernames = {record['author'] for record in records}
+        author_ids = dict(User.objects.using(self.database).filter(
+            username__in=usernames).values_list('username', 'id'))
+        missing = usernames - author_ids.keys()
+        if missing:
+            raise CommandError('Unknown authors: %s' %
+                               ', '.join(sorted(missing)))
+
+        now = timezone.now()
+        rows = [
+            [author_ids[record['author']], record['title'], record['content'],
+             make_excerpt(record['content']), record.get('created_at') or now, record.get('updated_at') or record.get('created_at') or now]
+            for record in records
+        ]
+
+        if self.use_copy:
+            self.copy_rows(Article._meta.db_table, ARTICLE_COLUMNS, rows)
+        else:
+            Article.objects.using(self.database).bulk_create(
+                [Article(**dict(zip(ARTICLE_COLUMNS, row))) for row in rows])
+        # Bulk loads skip the signals that maintain the author statistics.
+        stats.recompute(list(author_ids.values()), using=self.database)
+
+    def copy_rows(self, table, columns, rows, skip_conflicts=False):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+
+        column_list = ', '.join(columns)
+        copy = "COPY %%s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')" % column_list
+        with self.connection.cursor() as cursor:
+            if not skip_conflicts:
+                cursor.copy_expert(copy % table, buffer)
+                return
+            # COPY cannot skip conflicting rows, so stage them first.
+            cursor.execute(
+                'CREATE TEMP TABLE import_staging (LIKE %s INCLUDING DEFAULTS) ON COMMIT DROP' % table)
+            cursor.copy_expert(copy % 'import_staging', buffer)
+            cursor.execute('INSERT INTO %s (%s) SELECT %s FROM import_staging ON CONFLICT DO NOTHING' % (
+                table, column_list, column_list))
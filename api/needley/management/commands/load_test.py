@@ -0,0 +1,111 @@
+import json
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_QUERY = '{ allArticles(first: 20) { edges { node { title author { nickname } } } } }'
+LOGIN_MUTATION = '''
+    mutation Login($username: String!, $password: String!) {
+        login(input: {username: $username, password: $password}) { me { username } }
+    }
+'''
+
+
+class Command(BaseCommand):
+    help = '''Fire concurrent GraphQL requests at a running server and report throughput.
+
+    Compare the WSGI path (e.g. `gunicorn needley.wsgi`) with the ASGI path
+    (e.g. `uvicorn needley.asgi:application`) by running this against each.
+
+    With --login-storm N, the requests are sent twice: alone, then while N
+    threads keep sending failing logins, to show how sign-in bursts affect
+    read latency. Raise LOGIN_RATE_LIMITS on the server first, otherwise
+    most logins are throttled before any password is hashed.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://localhost:8000/graphql',
+            help='GraphQL endpoint to load.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help='Number of requests in flight at once.',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Total number of requests to send.',
+        )
+        parser.add_argument(
+            '--query', default=DEFAULT_QUERY,
+            help='GraphQL document to send.',
+        )
+        parser.add_argument(
+            '--login-storm', type=int, default=0,
+            help='Threads sending logins while the requests are measured.',
+        )
+
+    def handle(self, *args, **options):
+        body = json.dumps({'query': options['query']}).encode()
+        if not options['login_storm']:
+            self.run(options, body)
+            return
+
+        self.stdout.write('Baseline:')
+        self.run(options, body)
+
+        stop = threading.Event()
+        logins = []
+
+        def storm(idx):
+            while not stop.is_set():
+                variables = {'username': 'storm%d' % idx,
+                             'password': 'wrong-%d' % len(logins)}
+                logins.append(self.send(options['url'], json.dumps(
+                    {'query': LOGIN_MUTATION, 'variables': variables}).encode()))
+
+        threads = [threading.Thread(target=storm, args=(idx,))
+                   for idx in range(options['login_storm'])]
+        for thread in threads:
+            thread.start()
+        try:
+            self.stdout.write('During a login storm of %d threads:' %
+                              options['login_storm'])
+            self.run(options, body)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write('%d logins sent' % len(logins))
+
+    def send(self, url, body):
+        request = urllib.request.Request(
+            url, data=body, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                ok = response.status == 200
+        except OSError:
+            ok = False
+        return (ok, (time.perf_counter() - start) * 1000)
+
+    def run(self, options, body):
+        def send(_):
+            return self.send(options['url'], body)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(send, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for (ok, latency) in results)
+        failures = sum(1 for (ok, latency) in results if not ok)
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write('%d requests in %.2fs (%.1f req/s), %d failed' %
+                          (len(results), elapsed, len(results) / elapsed, failures))
+        self.stdout.write('latency p50=%.1fms p95=%.1fms p99=%.1fms' %
+                          (quantiles[49], quantiles[94], quantiles[98]))
@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from graphql import GraphQLError, parse, validate
+
+from needley.persisted import query_hash
+from needley.schema import schema
+
+
+class Command(BaseCommand):
+    help = 'Write the allowlist manifest of persisted queries from .graphql files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='.graphql/.gql files or directories to search for them.',
+        )
+        parser.add_argument(
+            '--output', default='specs/persisted_queries.json',
+            help='Manifest to write, used as GRAPHQL_QUERY_ALLOWLIST.',
+        )
+
+    def handle(self, *args, **options):
+        manifest = {}
+        for path in self.find_documents(options['paths']):
+            query = path.read_text()
+            try:
+                errors = validate(schema.graphql_schema, parse(query))
+            except GraphQLError as e:
+                errors = [e]
+            if errors:
+                raise CommandError('%s: %s' % (
+                    path, '; '.join(error.message for error in errors)))
+            manifest[query_hash(query)] = query
+
+        with open(options['output'], 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        self.stdout.write('Persisted %d queries to %s' %
+                          (len(manifest), options['output']))
+
+    def find_documents(self, paths):
+        for path in map(Path, paths):
+            if path.is_dir():
+                yield from sorted(path.rglob('*.graphql'))
+                yield from sorted(path.rglob('*.gql'))
+            else:
+                yield path
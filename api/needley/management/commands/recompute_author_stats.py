@@ -0,0 +1,32 @@
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from needley import stats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized articleCount/lastPostedAt of every user from their articles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Users recomputed per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        ids = User.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+        checked = changed = 0
+        while True:
+            batch = list(itertools.islice(ids, options['batch_size']))
+            if not batch:
+                break
+            with transaction.atomic():
+                changed += stats.recompute(batch)
+            checked += len(batch)
+        self.stdout.write('Checked %d users, repaired %d' % (checked, changed))
@@ -0,0 +1,54 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from needley import tasks
+
+
+class Command(BaseCommand):
+    help = '''Run queued background tasks (see needley/tasks.py).
+
+    Start as many workers as needed; each claims its own tasks. Set
+    PROMETHEUS_MULTIPROC_DIR as for the web workers so that task metrics
+    show up at /metrics. SIGTERM stops the worker after the current batch.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Run the tasks that are due, then exit.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Tasks claimed at a time (default: TASK_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to sleep when the queue is empty.',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+
+        requeued = tasks.requeue_stale()
+        if requeued:
+            self.stdout.write('Requeued %d stale tasks' % requeued)
+
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            claimed = tasks.run_pending(options['batch_size'])
+            processed += claimed
+            if claimed:
+                continue
+            if options['once']:
+                break
+            tasks.requeue_stale()
+            tasks.update_queue_metrics()
+            time.sleep(options['poll_interval'])
+        self.stdout.write('Processed %d tasks' % processed)
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,222 @@
+"""Prometheus metrics served at /metrics.
+
+Metrics are kept in process memory by prometheus_client. When several
+worker processes serve the API, point PROMETHEUS_MULTIPROC_DIR at an empty
+directory shared by them (it must be set before the workers start, and be
+cleared on deploys); every process then writes its samples there and
+/metrics aggregates them. Gunicorn should also call
+`prometheus_client.multiprocess.mark_process_dead(worker.pid)` from its
+`child_exit` hook.
+
+/metrics only answers clients in METRICS_ALLOWED_NETWORKS (checked against
+REMOTE_ADDR, so keep the route off the load balancer) or sending
+`Authorization: Bearer <METRICS_TOKEN>`.
+
+GraphQL operations are labelled with their type and root fields (e.g.
+`query`/`allArticles,me`) rather than the client chosen operation name, so
+the number of series stays bounded by the schema.
+"""
+import asyncio
+import ipaddress
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from graphql import FieldNode
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+
+from .backends.postgresql.base import get_pool_stats
+
+# Request latencies range from cached responses to heavy searches.
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+http_requests = Histogram(
+    'http_request_duration_seconds', 'Time spent serving HTTP requests.',
+    ['method', 'status'], buckets=BUCKETS)
+graphql_operations = Histogram(
+    'graphql_operation_duration_seconds', 'Time spent executing GraphQL operations.',
+    ['operation_type', 'operation'], buckets=BUCKETS)
+graphql_db_time = Histogram(
+    'graphql_operation_db_seconds', 'Time spent in SQL while executing GraphQL operations.',
+    ['operation_type', 'operation'], buckets=BUCKETS)
+graphql_errors = Counter(
+    'graphql_operation_errors_total', 'GraphQL operations that returned errors.',
+    ['operation_type', 'operation'])
+response_cache = Counter(
+    'graphql_response_cache_requests_total', 'Response cache lookups (see needley/cache.py).',
+    ['result'])
+logins = Counter(
+    'login_attempts_total', 'Login attempts.', ['result'])
+pool_connections = Gauge(
+    'db_pool_connections', 'Connections held by the pool.',
+    ['database', 'state'], multiprocess_mode='livesum')
+pool_checkouts = Counter(
+    'db_pool_checkouts_total', 'Connections handed out by the pool.', ['database'])
+pool_timeouts = Counter(
+    'db_pool_timeouts_total', 'Checkouts that timed out waiting for a connection.', ['database'])
+pool_wait = Counter(
+    'db_pool_wait_seconds_total', 'Time spent waiting for a pooled connection.', ['database'])
+tasks_processed = Counter(
+    'tasks_processed_total', 'Background tasks run (see needley/tasks.py).', ['task', 'result'])
+task_duration = Histogram(
+    'task_duration_seconds', 'Time spent running background tasks.', ['task'], buckets=BUCKETS)
+task_queue = Gauge(
+    'tasks_queued', 'Background tasks in the queue, by status.',
+    ['task', 'status'], multiprocess_mode='max')
+
+# Pool counters already exported by this process, keyed by alias. Requests
+# on several threads export them, hence the lock.
+exported_pool_stats = {}
+exported_pool_stats_lock = threading.Lock()
+
+
+def operation_labels(operation_ast):
+    if operation_ast is None:
+        return ('unknown', '')
+    fields = sorted({
+        selection.name.value for selection in operation_ast.selection_set.selections
+        if isinstance(selection, FieldNode) and not selection.name.value.startswith('__')
+    })
+    return (operation_ast.operation.value, ','.join(fields))
+
+
+class OperationObservation:
+    def __init__(self):
+        self.db_time = 0.0
+        self.failed = False
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+
+
+@contextmanager
+def observe_operation(operation_ast):
+    """Time a GraphQL operation and the SQL it runs.
+
+    Set `failed` on the yielded observation if the result has errors.
+    """
+    labels = operation_labels(operation_ast)
+    observation = OperationObservation()
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(observation.record_query))
+            yield observation
+    except Exception:
+        observation.failed = True
+        raise
+    finally:
+        graphql_operations.labels(*labels).observe(
+            time.perf_counter() - started)
+        graphql_db_time.labels(*labels).observe(observation.db_time)
+        if observation.failed:
+            graphql_errors.labels(*labels).inc()
+
+
+def record_cache_lookup(hit):
+    response_cache.labels('hit' if hit else 'miss').inc()
+
+
+def record_login(sender, **kwargs):
+    logins.labels('success').inc()
+
+
+def record_login_failure(sender, **kwargs):
+    logins.labels('failure').inc()
+
+
+def update_pool_stats():
+    for (alias, stats) in get_pool_stats().items():
+        in_use = stats['size'] - stats['idle']
+        pool_connections.labels(alias, 'in_use').set(in_use)
+        pool_connections.labels(alias, 'idle').set(stats['idle'])
+
+        # Pools keep running totals; export what was added since last time.
+        with exported_pool_stats_lock:
+            previous = exported_pool_stats.get(alias, {})
+            pool_checkouts.labels(alias).inc(
+                stats['checkouts'] - previous.get('checkouts', 0))
+            pool_timeouts.labels(alias).inc(
+                stats['timeouts'] - previous.get('timeouts', 0))
+            pool_wait.labels(alias).inc(
+                stats['wait_seconds_total'] - previous.get('wait_seconds_total', 0))
+            exported_pool_stats[alias] = stats
+
+
+def connect_signals():
+    from django.contrib.auth.signals import user_logged_in, user_login_failed
+
+    user_logged_in.connect(record_login, dispatch_uid='metrics-login')
+    user_login_failed.connect(
+        record_login_failure, dispatch_uid='metrics-login-failed')
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.observe(request, response, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.observe(request, response, started)
+
+    def observe(self, request, response, started):
+        http_requests.labels(request.method, response.status_code).observe(
+            time.perf_counter() - started)
+        update_pool_stats()
+        return response
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def can_scrape(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(authorization, 'Bearer %s' % token):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in getattr(settings, 'METRICS_ALLOWED_NETWORKS', ()))
+
+
+def metrics(request):
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    from . import tasks
+    tasks.update_queue_metrics()
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
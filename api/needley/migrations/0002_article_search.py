@@ -0,0 +1,72 @@
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# Case-insensitive `icontains` filters compile to `UPPER(col::text) LIKE ...`
+# on PostgreSQL, so the trigram indexes are built on the same expression.
+TRIGRAM_INDEXES = [
+    ('needley_article_title_trgm', 'needley_article', 'title'),
+    ('needley_article_content_trgm', 'needley_article', 'content'),
+    ('needley_user_username_trgm', 'needley_user', 'username'),
+    ('needley_user_nickname_trgm', 'needley_user', 'nickname'),
+]
+
+CREATE_SEARCH_TRIGGER = '''
+CREATE OR REPLACE FUNCTION needley_article_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER needley_article_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content, search_vector ON needley_article
+    FOR EACH ROW EXECUTE PROCEDURE needley_article_search_vector_update();
+
+UPDATE needley_article SET search_vector = NULL;
+
+CREATE INDEX needley_article_search_vector ON needley_article USING gin (search_vector);
+'''
+
+DROP_SEARCH_TRIGGER = '''
+DROP INDEX IF EXISTS needley_article_search_vector;
+DROP TRIGGER IF EXISTS needley_article_search_vector_trigger ON needley_article;
+DROP FUNCTION IF EXISTS needley_article_search_vector_update();
+'''
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_SEARCH_TRIGGER)
+    for (name, table, column) in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX {name} ON {table} USING gin (UPPER("{column}"::text) gin_trgm_ops)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for (name, table, column) in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+    schema_editor.execute(DROP_SEARCH_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('needley', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='article',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
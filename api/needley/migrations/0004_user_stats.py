@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 13:14
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill(apps, schema_editor):
+    User = apps.get_model('needley', 'User')
+    Article = apps.get_model('needley', 'Article')
+    articles = Article.objects.filter(author=OuterRef('pk')).order_by().values('author')
+    User.objects.update(
+        article_count=Coalesce(Subquery(articles.annotate(
+            count=Count('id')).values('count'), output_field=IntegerField()), 0),
+        last_posted_at=Subquery(articles.annotate(
+            last=Max('created_at')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('needley', '0003_article_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='article_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='last_posted_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 3.2.25 on 2026-10-17 13:23
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Compressed articles have an empty `content` column; index their excerpt.
+SEARCH_FUNCTION = '''
+CREATE OR REPLACE FUNCTION needley_article_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(%s, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+
+def update_search_function(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_FUNCTION % "nullif(NEW.content, ''), NEW.excerpt")
+
+
+def restore_search_function(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_FUNCTION % 'NEW.content')
+
+
+_whitespace = re.compile(r'\s+')
+
+
+def make_excerpt(content, length=280):
+    # Copy of needley.content.make_excerpt as of this migration.
+    text = _whitespace.sub(' ', content).strip()
+    if len(text) <= length:
+        return text
+    cut = text[:length - 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip() + '…'
+
+
+def backfill(apps, schema_editor):
+    Article = apps.get_model('needley', 'Article')
+    articles = Article.objects.only('content').order_by('id').iterator(chunk_size=2000)
+    batch = []
+    for article in articles:
+        article.excerpt = make_excerpt(article.content)
+        batch.append(article)
+        if len(batch) == 2000:
+            Article.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    Article.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('needley', '0005_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleContent',
+            fields=[
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='compressed_content', serialize=False, to='needley.article')),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=280),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(update_search_function, restore_search_function),
+    ]
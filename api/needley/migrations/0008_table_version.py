@@ -0,0 +1,78 @@
+# Generated by Django 3.2.25 on 2026-10-17 14:03
+
+from django.db import migrations, models
+
+# Tables whose writes are counted (the models cache.get_etag tags)
+TABLES = ['needley_article', 'needley_user']
+
+# One bump per statement, so bulk loads cost a single update.
+POSTGRESQL_FUNCTION = '''
+CREATE OR REPLACE FUNCTION needley_table_version_bump() RETURNS trigger AS $$
+BEGIN
+    UPDATE needley_tableversion SET version = version + 1 WHERE name = TG_TABLE_NAME;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+'''
+
+POSTGRESQL_TRIGGER = '''
+CREATE TRIGGER {table}_version_trigger
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+    FOR EACH STATEMENT EXECUTE PROCEDURE needley_table_version_bump();
+'''
+
+# SQLite only has row level triggers. They are lost when a migration
+# rebuilds the table, so such migrations must create them again.
+SQLITE_TRIGGER = '''
+CREATE TRIGGER {table}_version_{event} AFTER {event} ON {table}
+BEGIN
+    UPDATE needley_tableversion SET version = version + 1 WHERE name = '{table}';
+END;
+'''
+
+SQLITE_EVENTS = ['insert', 'update', 'delete']
+
+
+def create_triggers(apps, schema_editor):
+    TableVersion = apps.get_model('needley', 'TableVersion')
+    TableVersion.objects.bulk_create([TableVersion(name=table) for table in TABLES])
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRESQL_FUNCTION)
+        for table in TABLES:
+            schema_editor.execute(POSTGRESQL_TRIGGER.format(table=table))
+    elif vendor == 'sqlite':
+        for table in TABLES:
+            for event in SQLITE_EVENTS:
+                schema_editor.execute(SQLITE_TRIGGER.format(table=table, event=event))
+
+
+def drop_triggers(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for table in TABLES:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_version_trigger ON {table}')
+        schema_editor.execute('DROP FUNCTION IF EXISTS needley_table_version_bump()')
+    elif vendor == 'sqlite':
+        for table in TABLES:
+            for event in SQLITE_EVENTS:
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_version_{event}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('needley', '0007_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
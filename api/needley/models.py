@@ -1,8 +1,12 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 from django.core.validators import MinLengthValidator
 from django.contrib.auth.models import AbstractUser
 
+# Maximum length of Article.excerpt (see needley/content.py)
+EXCERPT_LENGTH = 280
+
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
@@ -13,6 +17,26 @@ class User(AbstractUser):
     avatar = models.URLField(
         validators=[MinLengthValidator(1)], max_length=200, null=True)
 
+    # Denormalized from the author's articles (see needley/stats.py)
+    article_count = models.PositiveIntegerField(default=0, editable=False)
+    last_posted_at = models.DateTimeField(null=True, editable=False)
+
+    # Date of the last write to this row
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['updated_at'], name='user_updated_idx'),
+            # recentUsers order and seek predicate
+            models.Index(fields=['-date_joined', '-id'], name='user_joined_idx'),
+        ]
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # Partial saves (e.g. of last_login on login) move updated_at too.
+        if update_fields:
+            update_fields = {*update_fields, 'updated_at'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+
     def __str__(self):
         return "@%s" % self.username
 
@@ -22,17 +46,109 @@ class Article(models.Model):
     author = models.ForeignKey(
         User,
         related_name="author",
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        # Covered by the (author, -created_at, -id) index below
+        db_index=False,
     )
     # The title of this article
     title = models.CharField(
         validators=[MinLengthValidator(1)], max_length=100)
     # Actual content of this article
+    # (empty if kept compressed in ArticleContent, see needley/content.py)
     content = models.TextField()
+    # Plain text preview of the content, computed on save
+    excerpt = models.CharField(
+        max_length=EXCERPT_LENGTH, blank=True, default='', editable=False)
 
     # Date when data were created/updated
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Weighted title/content lexemes for full text search.
+    # Maintained by a database trigger on PostgreSQL, never set from Python.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        # Newest first; id breaks ties between articles posted at once
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Articles by an author, newest first
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='article_author_created_idx'),
+            # Feed order and createdAt range filters
+            models.Index(fields=['-created_at', '-id'],
+                         name='article_created_idx'),
+            # updatedAt range filters
+            models.Index(fields=['-updated_at', '-id'],
+                         name='article_updated_idx'),
+        ]
+
     def __str__(self):
         return "\"%s\" by %s" % (self.title, self.author.profile)
+
+
+class ArticleContent(models.Model):
+    """The compressed body of an article stored outside the article table."""
+    article = models.OneToOneField(
+        Article,
+        primary_key=True,
+        related_name='compressed_content',
+        on_delete=models.CASCADE,
+    )
+    # Compression format of `data`
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+
+    def __str__(self):
+        return "Content of article #%s (%s)" % (self.article_id, self.codec)
+
+
+class TableVersion(models.Model):
+    """A counter bumped by a database trigger on every write to a table.
+
+    Used to tag responses (see cache.get_etag): it changes with every
+    insert, update and delete, including bulk writes and writes from other
+    processes, and becomes visible in the same commit as the write.
+    """
+    # Database table the counter belongs to
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return "%s v%d" % (self.name, self.version)
+
+
+class Task(models.Model):
+    """A background job run by `manage.py run_tasks` (see needley/tasks.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Name the task function was registered under
+    name = models.CharField(max_length=100)
+    # Keyword arguments of the task function
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    # Not run before this time (used to back off retries)
+    run_at = models.DateTimeField(default=timezone.now)
+    # When a worker claimed this task, to requeue tasks of crashed workers
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim queued tasks in run_at order
+            models.Index(fields=['status', 'run_at'],
+                         name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return "%s #%s (%s)" % (self.name, self.id, self.status)
@@ -0,0 +1,156 @@
+"""Password hashing off the request thread, and login rate limiting.
+
+Hashing a password deliberately takes tens of milliseconds of CPU. Done
+inline, a burst of sign-ins holds the GIL and stalls every other request
+served by the process. Here hashes are computed by a pool of
+PASSWORD_HASHING_WORKERS processes instead. At most PASSWORD_HASHING_QUEUE
+jobs may be queued or running; callers beyond that wait up to
+PASSWORD_HASHING_TIMEOUT seconds and then get `PasswordHashingBusy`, so a
+login storm is shed instead of piling up.
+
+Workers only import the hashers, not the app registry, so this module must
+not import models.
+"""
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import caches
+
+RATE_LIMIT_KEY = 'login-attempts:%s:%s'
+
+
+class PasswordHashingBusy(Exception):
+    pass
+
+
+class RateLimited(Exception):
+    pass
+
+
+def hash_password(raw):
+    return hashers.make_password(raw)
+
+
+def verify_password(raw, encoded):
+    """Return whether `raw` matches, and whether `encoded` should be re-hashed."""
+    if not hashers.check_password(raw, encoded):
+        return (False, False)
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    must_update = hasher.algorithm != preferred.algorithm or preferred.must_update(
+        encoded)
+    return (True, must_update)
+
+
+class HashingPool:
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that is serving requests on
+                # several threads can copy held locks into the child.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashingBusy(
+                'The server is busy signing users in. Please try again.')
+        try:
+            if not self.workers:
+                return fn(*args)
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(
+                getattr(settings, 'PASSWORD_HASHING_WORKERS', 2),
+                getattr(settings, 'PASSWORD_HASHING_QUEUE', 32),
+                getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 5),
+            )
+        return _pool
+
+
+def make_password(raw):
+    return get_pool().run(hash_password, raw)
+
+
+def check_password(raw, encoded):
+    return get_pool().run(verify_password, raw, encoded)
+
+
+def client_ip(request):
+    """Return the address of the client that sent `request`.
+
+    Behind load balancers or other proxies, REMOTE_ADDR is the last proxy's;
+    the client's is then read from TRUSTED_PROXY_HEADER (e.g.
+    X-Forwarded-For), as seen by the outermost of the TRUSTED_PROXY_COUNT
+    proxies that append to it. Earlier entries are set by the client and
+    are not trusted.
+    """
+    header = getattr(settings, 'TRUSTED_PROXY_HEADER', None)
+    if header:
+        addresses = [address.strip() for address in request.META.get(header, '').split(',')]
+        count = getattr(settings, 'TRUSTED_PROXY_COUNT', 1)
+        if count and len(addresses) >= count and addresses[-count]:
+            return addresses[-count]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_rate_limit(request, username):
+    """Count a login attempt, raising RateLimited past LOGIN_RATE_LIMITS.
+
+    Limits are fixed windows per client address (credential stuffing tries
+    many usernames from one address) and per username (guessing one
+    account's password from many addresses).
+    """
+    limits = getattr(settings, 'LOGIN_RATE_LIMITS', {})
+    cache = caches[getattr(settings, 'LOGIN_RATE_LIMIT_CACHE', 'default')]
+    scopes = {
+        'ip': client_ip(request),
+        'username': username.lower(),
+    }
+    for (scope, value) in scopes.items():
+        if scope not in limits:
+            continue
+        (attempts, window) = limits[scope]
+        # The value comes from the client; hashed, any value is a valid
+        # cache key (memcached rejects spaces, control characters and keys
+        # over 250 bytes).
+        key = RATE_LIMIT_KEY % (scope, hashlib.sha256(value.encode()).hexdigest())
+        cache.add(key, 0, window)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr().
+            cache.set(key, 1, window)
+            count = 1
+        if count > attempts:
+            raise RateLimited('Too many login attempts. Try again later.')
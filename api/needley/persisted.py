@@ -0,0 +1,76 @@
+"""Automatic persisted queries.
+
+Clients may send `extensions.persistedQuery.sha256Hash` instead of the
+query text. Unknown hashes are answered with `PersistedQueryNotFound`, after
+which the client retries with both the hash and the text and the server
+remembers the pair for the timeout of its cache alias. When `GRAPHQL_QUERY_ALLOWLIST` names a manifest written
+by `manage.py persist_queries`, only the documents in it are executed and
+clients cannot register new ones.
+"""
+import hashlib
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+
+QUERY_KEY = 'graphql-persisted:%s'
+
+
+class PersistedQueryError(Exception):
+    pass
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def load_allowlist(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_allowlist():
+    path = getattr(settings, 'GRAPHQL_QUERY_ALLOWLIST', None)
+    return load_allowlist(str(path)) if path else None
+
+
+def get_cache():
+    return caches[getattr(settings, 'GRAPHQL_PERSISTED_QUERY_CACHE', 'persisted-queries')]
+
+
+def resolve(query, extensions):
+    """Return the query text to execute, or raise `PersistedQueryError`."""
+    persisted = extensions.get('persistedQuery') if isinstance(
+        extensions, dict) else None
+    allowlist = get_allowlist()
+
+    if not persisted:
+        if allowlist is not None and query and query_hash(query) not in allowlist:
+            raise PersistedQueryError('PersistedQueryNotAllowed')
+        return query
+
+    if persisted.get('version') != 1:
+        raise PersistedQueryError('Unsupported persisted query version')
+    sha256 = persisted.get('sha256Hash')
+    if not isinstance(sha256, str):
+        raise PersistedQueryError('Missing persisted query hash')
+
+    if query:
+        if query_hash(query) != sha256:
+            raise PersistedQueryError('provided sha does not match query')
+        if allowlist is not None:
+            if sha256 not in allowlist:
+                raise PersistedQueryError('PersistedQueryNotAllowed')
+        else:
+            get_cache().add(QUERY_KEY % sha256, query)
+        return query
+
+    if allowlist is not None:
+        query = allowlist.get(sha256)
+    else:
+        query = get_cache().get(QUERY_KEY % sha256)
+    if query is None:
+        raise PersistedQueryError('PersistedQueryNotFound')
+    return query
@@ -0,0 +1,228 @@
+"""Per-request profiling of GraphQL resolvers and SQL.
+
+`ProfilingMiddleware` attaches a `Profile` to a request when either
+
+* the client sends the `X-Needley-Profile` header and is allowed to see
+  profiles (staff users, or anyone while DEBUG is on); the summary is then
+  returned in `extensions.profile` of the GraphQL response, or
+* the request is picked by `GRAPHQL_PROFILE_SAMPLE_RATE`; its trace is then
+  logged as one JSON line to the `needley.profiling` logger.
+
+Traces include `stacks`, self times in microseconds keyed by
+`Query.allArticles;...;ArticleNode.author;SQL`-style frames, which is the
+folded format flame graph tools read. Requests that are not profiled pay
+nothing beyond the sampling check.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Number of slowest resolvers and duplicated statements reported.
+TOP = 10
+
+
+class Profile:
+    def __init__(self, expose=False):
+        # expose: whether the client asked for the profile in the response
+        self.expose = expose
+        self.started = time.perf_counter()
+        self.duration = None
+        self.operation = None
+        self.phases = {}
+        self.resolvers = defaultdict(lambda: [0, 0.0])
+        self.queries = []
+        self.stack = ()
+        self.stacks = Counter()
+        # Response path (without list indices) -> frames leading to it.
+        self.paths = {}
+        # Thread whose queries ProfilingMiddleware records, if any; views
+        # running elsewhere record their own (see AsyncGraphQLView).
+        self.capturing_thread = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(
+                name, 0.0) + time.perf_counter() - started
+
+    @contextmanager
+    def frame(self, name, path):
+        # Child fields are resolved after their parent has returned, so the
+        # stack is rebuilt from the response path rather than from nesting.
+        path = tuple(key for key in path if isinstance(key, str))
+        self.stack = self.paths[path] = self.paths.get(path[:-1], ()) + (name,)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stacks[self.stack] += elapsed
+            self.stack = ()
+            resolver = self.resolvers[name]
+            resolver[0] += 1
+            resolver[1] += elapsed
+
+    def record_query(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper().
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries.append((sql, repr(params), elapsed))
+            self.stacks[self.stack + ('SQL',)] += elapsed
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def summary(self):
+        duration = self.duration
+        if duration is None:
+            duration = time.perf_counter() - self.started
+
+        statements = Counter((sql, params) for (sql, params, _) in self.queries)
+        shapes = Counter(sql for (sql, _, _) in self.queries)
+        slowest = sorted(self.resolvers.items(),
+                         key=lambda item: item[1][1], reverse=True)
+        return {
+            'duration': round(duration * 1000, 3),
+            'phases': {name: round(elapsed * 1000, 3) for (name, elapsed) in self.phases.items()},
+            'resolvers': [
+                {'field': name, 'calls': calls, 'duration': round(elapsed * 1000, 3)}
+                for (name, (calls, elapsed)) in slowest[:TOP]
+            ],
+            'sql': {
+                'count': len(self.queries),
+                'duration': round(sum(elapsed for (_, _, elapsed) in self.queries) * 1000, 3),
+                # Same statement and parameters: the result could have been reused.
+                'duplicates': [
+                    {'sql': sql, 'count': count}
+                    for ((sql, _), count) in statements.most_common(TOP) if count > 1
+                ],
+                # Same statement, different parameters: usually an N+1 pattern.
+                'similar': [
+                    {'sql': sql, 'count': count}
+                    for (sql, count) in shapes.most_common(TOP) if count > 1
+                ],
+            },
+        }
+
+    def folded_stacks(self):
+        # Resolver frames include the SQL they ran, so subtract it to get the
+        # self time flame graphs expect.
+        self_times = Counter(self.stacks)
+        for (stack, elapsed) in self.stacks.items():
+            if stack[-1] == 'SQL' and len(stack) > 1:
+                self_times[stack[:-1]] -= elapsed
+        return {
+            ';'.join(stack): round(elapsed * 1e6)
+            for (stack, elapsed) in self_times.items() if elapsed > 0
+        }
+
+    def trace(self, request):
+        trace = self.summary()
+        trace.update({
+            'path': request.path,
+            'method': request.method,
+            'operation': self.operation,
+            'stacks': self.folded_stacks(),
+        })
+        return trace
+
+
+def get_profile(request):
+    return getattr(request, 'profile', None)
+
+
+@contextmanager
+def capture_queries(profile):
+    """Record the queries run by this thread's connections into `profile`."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(profile.record_query))
+        yield
+
+
+class ResolverMiddleware:
+    """Graphene middleware timing every resolver into the request's profile.
+
+    GraphQLView only installs it for profiled requests.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def resolve(self, next, root, info, **args):
+        name = '%s.%s' % (info.parent_type.name, info.field_name)
+        with self.profile.frame(name, info.path.as_list()):
+            return next(root, info, **args)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.header = getattr(
+            settings, 'GRAPHQL_PROFILE_HEADER', 'HTTP_X_NEEDLEY_PROFILE')
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        expose = self.header in request.META and self.can_expose(request)
+        sampled = self.sample()
+        if not (expose or sampled):
+            return self.get_response(request)
+
+        profile = request.profile = Profile(expose=expose)
+        profile.capturing_thread = threading.get_ident()
+        with capture_queries(profile):
+            response = self.get_response(request)
+        self.finish(request, profile, sampled)
+        return response
+
+    async def __acall__(self, request):
+        # Loading the user may query the database.
+        expose = self.header in request.META and await sync_to_async(
+            self.can_expose)(request)
+        sampled = self.sample()
+        if not (expose or sampled):
+            return await self.get_response(request)
+
+        # No queries run on the event loop thread; the view records its own.
+        profile = request.profile = Profile(expose=expose)
+        response = await self.get_response(request)
+        self.finish(request, profile, sampled)
+        return response
+
+    def sample(self):
+        return random.random() < getattr(
+            settings, 'GRAPHQL_PROFILE_SAMPLE_RATE', 0)
+
+    def finish(self, request, profile, sampled):
+        profile.finish()
+        if sampled:
+            logger.info(json.dumps(profile.trace(request)))
+
+    def can_expose(self, request):
+        # Profiles reveal SQL, so only trusted clients get them back.
+        return settings.DEBUG or request.user.is_staff
@@ -0,0 +1,140 @@
+"""Load only the columns a GraphQL query selects.
+
+`project(queryset, info, node_type)` reads the fields selected on the node
+type (through connection `edges { node }` if needed, and through fragments)
+and narrows the queryset with `.only()`, following selected foreign keys
+with `select_related`. A list of articles that asks for `title` and
+`createdAt` then never reads `content`.
+
+Selected fields that are not model fields make the projection give up and
+load every column, unless the node type lists the columns they need in
+`projection_columns`, e.g. `{'excerpt': ('content',)}`.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from graphene import Dynamic, NonNull
+from graphene.utils.str_converters import to_camel_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode, get_named_type
+
+
+class Unprojectable(Exception):
+    pass
+
+
+def collect_fields(selection_set, fragments, fields=None):
+    """Group the field nodes of a selection set by field name."""
+    if fields is None:
+        fields = {}
+    if selection_set is None:
+        return fields
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            collect_fields(selection.selection_set, fragments, fields)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                collect_fields(fragment.selection_set, fragments, fields)
+    return fields
+
+
+def merge_selections(field_nodes, fragments):
+    fields = {}
+    for node in field_nodes:
+        collect_fields(node.selection_set, fragments, fields)
+    return fields
+
+
+def node_selections(info):
+    """Return the fields selected on the node(s) resolved by `info`."""
+    fields = merge_selections(info.field_nodes, info.fragments)
+    return_type = get_named_type(info.return_type)
+    if 'edges' not in getattr(return_type, 'fields', {}):
+        return fields
+    edges = merge_selections(fields.get('edges', []), info.fragments)
+    return merge_selections(edges.get('node', []), info.fragments)
+
+
+def graphql_names(node_type):
+    """Map GraphQL field names of a graphene type to its Python field names."""
+    return {
+        getattr(field, 'name', None) or to_camel_case(name): name
+        for (name, field) in node_type._meta.fields.items()
+    }
+
+
+def field_type(node_type, name):
+    field = node_type._meta.fields[name]
+    if isinstance(field, Dynamic):
+        # Model relations are converted lazily.
+        field = field.get_type()
+    type_ = field.type
+    while isinstance(type_, NonNull):
+        type_ = type_.of_type
+    return type_
+
+
+def columns(node_type, selections, fragments, prefix=''):
+    """Return (`only` names, `select_related` names) for the selections."""
+    model = node_type._meta.model
+    names = graphql_names(node_type)
+    extra = getattr(node_type, 'projection_columns', {})
+
+    only = [prefix + model._meta.pk.name]
+    related = []
+    for (graphql_name, field_nodes) in selections.items():
+        if graphql_name.startswith('__'):
+            continue
+        name = names.get(graphql_name)
+        if name is None:
+            raise Unprojectable(graphql_name)
+        if name == 'id':
+            continue
+        if name in extra:
+            only.extend(prefix + column for column in extra[name])
+            continue
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise Unprojectable(graphql_name)
+        if not model_field.concrete:
+            raise Unprojectable(graphql_name)
+
+        only.append(prefix + name)
+        if isinstance(model_field, models.ForeignKey):
+            related_type = field_type(node_type, name)
+            try:
+                (related_only, related_related) = columns(
+                    related_type, merge_selections(field_nodes, fragments), fragments,
+                    prefix=prefix + name + '__')
+            except Unprojectable:
+                # Leave the relation to its resolver (e.g. a data loader).
+                continue
+            related.append(prefix + name)
+            only.extend(related_only)
+            related.extend(related_related)
+    return (only, related)
+
+
+def project(queryset, info, node_type):
+    """Narrow `queryset` to the columns selected by the query of `info`."""
+    if info is None:
+        return queryset
+    try:
+        (only, related) = columns(
+            node_type, node_selections(info), info.fragments)
+    except Unprojectable:
+        return queryset
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*only)
+
+
+def add_columns(queryset, names):
+    """Also load `names` if `queryset` was narrowed by `project`, e.g. the
+    ordering columns read to build cursors."""
+    (loaded, deferred) = queryset.query.deferred_loading
+    if deferred or not loaded:
+        return queryset
+    return queryset.only(*loaded, *names)
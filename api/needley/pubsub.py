@@ -0,0 +1,84 @@
+"""Publish/subscribe used to push events to GraphQL subscriptions.
+
+`get_broker()` returns the broker named by GRAPHQL_SUBSCRIPTION_BROKER.
+A broker implements `publish(channel, message)`, callable from any thread
+(mutations run on worker threads), and `subscribe(channel)`, an async
+iterator of messages for the calling event loop. Messages are plain JSON
+compatible dicts so that a broker backed by e.g. Redis or PostgreSQL
+LISTEN/NOTIFY can be dropped in for multi-process deployments.
+"""
+import abc
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+ARTICLES_CHANNEL = 'articles'
+
+
+class Broker(abc.ABC):
+    # Whether only subscribers of the publishing process get the messages
+    process_local = False
+
+    @abc.abstractmethod
+    def publish(self, channel, message):
+        """Send `message` to the current subscribers of `channel`."""
+
+    @abc.abstractmethod
+    def subscribe(self, channel):
+        """Return an async iterator of the messages published to `channel`."""
+
+
+class InMemoryBroker(Broker):
+    """Broker delivering messages to subscribers in this process only.
+
+    Each subscriber has a queue of at most `max_queue` messages; messages
+    for a subscriber that has fallen that far behind are dropped so that a
+    slow client cannot grow memory without bound.
+    """
+
+    process_local = True
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for (loop, queue) in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, message)
+
+    @staticmethod
+    def _put(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(),
+                      asyncio.Queue(self.max_queue))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(
+                settings, 'GRAPHQL_SUBSCRIPTION_BROKER', 'needley.pubsub.InMemoryBroker'))()
+        return _broker
@@ -0,0 +1,121 @@
+"""Route GraphQL query operations to read replicas.
+
+`ReplicaRoutingMiddleware` gives each request a `RoutingState`. The GraphQL
+view runs query operations inside `read_from_replicas()`, during which reads
+go to an alias from `DATABASE_REPLICAS` picked at random once per request
+(so that all reads of a request see the same snapshot); everything else (mutations,
+admin, management commands) uses the primary. A client that has just written
+reads from the primary for `DATABASE_REPLICA_STICKINESS` seconds so that it
+sees its own writes despite replication lag.
+"""
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = 'needley_primary_until'
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        # Reads must stay on the primary for this request
+        self.pinned = pinned
+        self.use_replicas = False
+        self.wrote = False
+        # Replica serving this request's reads, picked on the first one
+        self.replica = None
+
+
+@contextmanager
+def request_routing(pinned=False):
+    state = RoutingState(pinned=pinned)
+    token = routing_state.set(state)
+    try:
+        yield state
+    finally:
+        routing_state.reset(token)
+
+
+@contextmanager
+def read_from_replicas():
+    state = routing_state.get()
+    if state is None or state.pinned:
+        yield
+        return
+
+    state.use_replicas = True
+    try:
+        yield
+    finally:
+        state.use_replicas = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if state is not None and state.use_replicas and replicas:
+            if state.replica not in replicas:
+                state.replica = random.choice(replicas)
+            return state.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with request_routing(pinned=self.is_pinned(request)) as state:
+            response = self.get_response(request)
+        return self.stick(state, response)
+
+    async def __acall__(self, request):
+        # The state is shared with the threads the view runs on through the
+        # copied context.
+        with request_routing(pinned=self.is_pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.stick(state, response)
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def stick(self, state, response):
+        stickiness = getattr(settings, 'DATABASE_REPLICA_STICKINESS', 0)
+        if state.wrote and stickiness:
+            response.set_cookie(STICKY_COOKIE, str(time.time() + stickiness),
+                                max_age=stickiness, httponly=True, samesite='Lax')
+        return response
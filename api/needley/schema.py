@@ -1,15 +1,25 @@
 from icecream import ic
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user, login, authenticate, get_user_model
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.utils.dateparse import parse_datetime
 from graphene import relay, ObjectType
 from graphene_django import DjangoObjectType
 from graphene_django.filter import DjangoFilterConnectionField
 from graphene_django.types import DjangoObjectTypeOptions
+from graphene_django.utils import bypass_get_queryset
 from graphql_relay import from_global_id
 
 import graphene
 
-from .models import Article
+from .fields import BatchedConnectionField, CountableConnection, KeysetConnectionField
+from .content import (load_contents, make_excerpt, prepare as prepare_content,
+                      store as store_content)
+from .loaders import get_loaders
+from .models import EXCERPT_LENGTH, Article
+from . import cache, passwords, projection, pubsub, search, stats, tasks
 
 User = get_user_model()
 
@@ -20,14 +30,20 @@ class UserMeta:
         'username': ['exact', 'icontains'],
         'nickname': ['exact', 'icontains'],
     }
-    fields = ['username', 'nickname', 'avatar', 'date_joined', 'last_login']
+    fields = ['username', 'nickname', 'avatar', 'date_joined', 'last_login',
+              'article_count', 'last_posted_at']
     interfaces = (relay.Node, )
+    connection_class = CountableConnection
 
 
 class UserNode(DjangoObjectType):
     class Meta(UserMeta):
         pass
 
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return projection.project(queryset, info, cls)
+
 
 class MeUserNode(UserNode):
     class Meta(UserMeta):
@@ -44,7 +60,8 @@ class Me(graphene.ObjectType):
         user = info.context.user
         if not user.is_authenticated:
             raise Exception('You are not authorized.')
-        return MeUserNode.get_node(info, info.context.user.id)
+        # Already loaded (usually from the cache) by AuthenticationMiddleware.
+        return user
 
     def resolve_ok(parent, info):
         return info.context.user.is_authenticated
@@ -63,19 +80,73 @@ class ArticleNode(DjangoObjectType):
         }
         fields = ['author', 'title', 'content', 'created_at', 'updated_at']
         interfaces = (relay.Node, )
+        connection_class = CountableConnection
+
+    # Plain text preview of the content, of at most `length` characters
+    excerpt = graphene.String(required=True, length=graphene.Int())
+
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        # The search vector is only ever read by the database itself.
+        return projection.project(queryset.defer('search_vector'), info, cls)
+
+    @classmethod
+    def batch_load(cls, info, articles):
+        loaders = get_loaders(info)
+        deferred = [article.get_deferred_fields() for article in articles]
+        # Articles projected without their author do not need it loaded.
+        loaders.users.enqueue(
+            article.author_id for (article, fields) in zip(articles, deferred)
+            if 'author_id' not in fields and not Article.author.is_cached(article))
+        # Nor do articles projected without content need their bodies.
+        loaders.contents.enqueue(
+            article.id for (article, fields) in zip(articles, deferred)
+            if 'content' not in fields and not article.content)
+
+    @bypass_get_queryset
+    def resolve_author(parent, info):
+        # Joined by the projection when only author columns are selected.
+        if Article.author.is_cached(parent):
+            return parent.author
+        return get_loaders(info).users.load(parent.author_id)
+
+    def resolve_content(parent, info):
+        if parent.content:
+            return parent.content
+        # Empty when the body is stored compressed (see content.py).
+        body = get_loaders(info).contents.load(parent.id)
+        return parent.content if body is None else body
+
+    def resolve_excerpt(parent, info, length=None):
+        if length is None:
+            return parent.excerpt
+        if length < 1:
+            raise Exception('Excerpt length must be positive.')
+        return make_excerpt(parent.excerpt, min(length, EXCERPT_LENGTH))
 
 
 class Query(graphene.ObjectType):
     user = relay.Node.Field(UserNode)
     all_users = DjangoFilterConnectionField(UserNode)
+    # Same as allUsers but paginated by (dateJoined, id) cursors
+    recent_users = KeysetConnectionField(
+        UserNode, ordering=('-date_joined', '-id'))
     me = graphene.Field(Me)
 
     article = relay.Node.Field(ArticleNode)
-    all_articles = DjangoFilterConnectionField(ArticleNode)
+    all_articles = BatchedConnectionField(ArticleNode)
+    # Same as allArticles but paginated by (createdAt, id) cursors
+    recent_articles = KeysetConnectionField(ArticleNode)
+    # Full text search over title and content, best matches first
+    search_articles = BatchedConnectionField(
+        ArticleNode, query=graphene.String(required=True))
 
     def resolve_me(parent, info):
         return Me()
 
+    def resolve_search_articles(parent, info, query, **kwargs):
+        return search.search_articles(query)
+
 
 class CreateUser(relay.ClientIDMutation):
     class Input:
@@ -95,8 +166,10 @@ class CreateUser(relay.ClientIDMutation):
         nickname = input.get('nickname')
         avatar = input.get('avatar')
 
-        login_user = User.objects.create_user(
-            username=username, email=email, password=password, nickname=nickname, avatar=avatar)
+        # Same as User.objects.create_user, but hashed in the worker pool.
+        login_user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email),
+                          password=passwords.make_password(password), nickname=nickname, avatar=avatar)
+        login_user.save()
 
         login(info.context, login_user)
         ic(login_user)
@@ -113,6 +186,7 @@ class Login(relay.ClientIDMutation):
 
     @classmethod
     def mutate_and_get_payload(cls, root, info, **input):
+        passwords.check_rate_limit(info.context, input.get('username'))
         login_user = authenticate(info.context, username=input.get(
             'username'), password=input.get('password'))
         if login_user is not None:
@@ -139,16 +213,169 @@ class PostArticle(relay.ClientIDMutation):
         content = input.get('content')
         user = info.context.user
 
-        article = Article.objects.create(
-            author=user, title=title, content=content)
+        # Statistics and notifications are queued with the article and
+        # handled after commit.
+        with transaction.atomic():
+            article = Article.objects.create(
+                author=user, title=title, content=content)
+            queue_publish([article])
 
         return PostArticle(article=article)
 
 
+class ArticleInput(graphene.InputObjectType):
+    title = graphene.String(required=True)
+    content = graphene.String(required=True)
+
+
+class ArticleError(graphene.ObjectType):
+    # Position of the rejected article in the input
+    index = graphene.Int(required=True)
+    # Input field the error is about, if any
+    field = graphene.String()
+    message = graphene.String(required=True)
+
+
+class PostArticles(graphene.Mutation):
+    """Post many articles in one transaction.
+
+    Invalid articles are reported in `errors` and the others are still
+    posted; `articles` follows the order of the input, with null in place
+    of rejected ones.
+    """
+    class Arguments:
+        input = graphene.List(graphene.NonNull(ArticleInput), required=True)
+
+    articles = graphene.List(ArticleNode, required=True)
+    errors = graphene.List(graphene.NonNull(ArticleError), required=True)
+
+    @classmethod
+    def mutate(cls, root, info, input):
+        if not info.context.user.is_authenticated:
+            raise Exception('Please login before posting your article.')
+        max_batch_size = getattr(settings, 'GRAPHQL_MAX_BATCH_SIZE', 100)
+        if len(input) > max_batch_size:
+            raise Exception(
+                'At most %d articles can be posted at once.' % max_batch_size)
+
+        user = info.context.user
+        articles = []
+        errors = []
+        for (index, item) in enumerate(input):
+            article = Article(author=user, title=item.title, content=item.content)
+            try:
+                article.full_clean(
+                    exclude=['author', 'search_vector'], validate_unique=False)
+            except ValidationError as e:
+                errors.extend(
+                    ArticleError(index=index, field=field, message=message)
+                    for (field, messages) in e.message_dict.items() for message in messages)
+                article = None
+            articles.append(article)
+
+        valid = [article for article in articles if article is not None]
+        with transaction.atomic():
+            create_articles(user, valid)
+            queue_publish(valid)
+
+        return PostArticles(articles=articles, errors=errors)
+
+
+def create_articles(author, articles):
+    """Insert `articles` by `author` with as few queries as the database allows."""
+    if not articles:
+        return
+    if not connections[router.db_for_write(Article)].features.can_return_rows_from_bulk_insert:
+        # Without the new ids nothing can refer to the articles; save them
+        # one by one (the signals do the rest).
+        for article in articles:
+            article.save()
+        return
+
+    for article in articles:
+        prepare_content(article)
+    Article.objects.bulk_create(articles)
+    store_content(articles)
+    # bulk_create sends no signals.
+    stats.enqueue_recount([author.id])
+    cache.invalidate(Article)
+
+
 class Mutation(graphene.ObjectType):
     create_user = CreateUser.Field()
     login = Login.Field()
     post_article = PostArticle.Field()
+    post_articles = PostArticles.Field()
+
+
+# Author fields sent along with new articles, so that subscribers never
+# need to query the database. Messages may pass through an external broker,
+# so they carry no personal data such as the email address.
+AUTHOR_FIELDS = UserMeta.fields + ['id']
+
+
+def publish_article(article):
+    author = article.author
+    pubsub.get_broker().publish(pubsub.ARTICLES_CHANNEL, {
+        'id': article.id,
+        'title': article.title,
+        'content': article.content,
+        'excerpt': article.excerpt,
+        'created_at': article.created_at.isoformat(),
+        'updated_at': article.updated_at.isoformat(),
+        'author': {
+            name: value.isoformat() if hasattr(value, 'isoformat') else value
+            for (name, value) in ((name, getattr(author, name)) for name in AUTHOR_FIELDS)
+        },
+    })
+
+
+@tasks.task(batch=True)
+def publish_articles(payloads):
+    ids = [payload['article_id'] for payload in payloads]
+    articles = Article.objects.filter(id__in=ids).select_related('author').order_by('id')
+    bodies = dict(zip(ids, load_contents(ids)))
+    for article in articles:
+        if bodies[article.id] is not None:
+            article.content = bodies[article.id]
+        publish_article(article)
+
+
+def queue_publish(articles):
+    """Publish new `articles` once the current transaction commits.
+
+    The run_tasks worker publishes them, unless the broker only reaches
+    subscribers of this process.
+    """
+    if pubsub.get_broker().process_local:
+        transaction.on_commit(lambda: [publish_article(article) for article in articles])
+        return
+    for article in articles:
+        tasks.enqueue(publish_articles, article_id=article.id)
+
+
+def article_from_message(info, message):
+    author = dict(message['author'])
+    for name in ('date_joined', 'last_login', 'last_posted_at'):
+        author[name] = author[name] and parse_datetime(author[name])
+    author = User(**author)
+
+    loaders = get_loaders(info)
+    loaders.users.clear(author.id)
+    loaders.users.prime(author.id, author)
+
+    return Article(id=message['id'], title=message['title'], content=message['content'],
+                   excerpt=message['excerpt'], created_at=parse_datetime(message['created_at']),
+                   updated_at=parse_datetime(message['updated_at']), author_id=author.id)
+
+
+class Subscription(graphene.ObjectType):
+    new_article = graphene.Field(ArticleNode, required=True)
+
+    async def subscribe_new_article(root, info):
+        async for message in pubsub.get_broker().subscribe(pubsub.ARTICLES_CHANNEL):
+            yield article_from_message(info, message)
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+schema = graphene.Schema(
+    query=Query, mutation=Mutation, subscription=Subscription)
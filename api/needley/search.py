@@ -0,0 +1,31 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+
+from .models import Article
+
+# Text search configuration used by the `search_vector` trigger (see
+# migration 0002). `simple` does no stemming, which suits mixed
+# Japanese/English posts better than a language specific one.
+SEARCH_CONFIG = 'simple'
+
+
+def search_articles(query, queryset=None):
+    """Return articles matching `query`, best matches first.
+
+    On PostgreSQL this uses the trigger-maintained `search_vector` column and
+    its GIN index. Other databases fall back to substring matching.
+    """
+    if queryset is None:
+        queryset = Article.objects.all()
+
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(
+            Q(title__icontains=query) | Q(content__icontains=query)
+        ).order_by('-created_at', '-id')
+
+    search_query = SearchQuery(
+        query, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-id')
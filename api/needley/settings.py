@@ -12,6 +12,7 @@ https://docs.djangoproject
     .com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Full text search
 
     'graphene_django',  # Required for GraphiQL
 
@@ -46,11 +48,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'needley.metrics.MetricsMiddleware',
+    'needley.encoding.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'needley.routers.ReplicaRoutingMiddleware',
+    'needley.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,19 +87,166 @@ WSGI_APPLICATION = 'needley.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'db',
-        'PORT': 5432,
+        # PostgreSQL plus health checks and pooling, see needley/backends
+        'ENGINE': 'needley.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'postgres'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
+        'HOST': os.environ.get('POSTGRES_HOST', 'db'),
+        'PORT': int(os.environ.get('POSTGRES_PORT', 5432)),
+        # Seconds a thread keeps its connection between requests; 0 closes
+        # it (or returns it to the pool) after every request.
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        # Check a reused connection with `SELECT 1` once per request.
+        'CONN_HEALTH_CHECKS': os.environ.get('DATABASE_CONN_HEALTH_CHECKS', '1') == '1',
+        # In-process pool shared by all threads (useful for the ASGI view's
+        # executor threads together with DATABASE_CONN_MAX_AGE=0); 0 disables it.
+        'POOL_SIZE': int(os.environ.get('DATABASE_POOL_SIZE', 0)),
+        'POOL_TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
     }
 }
 
+# Read replicas for GraphQL queries, e.g. DATABASE_REPLICA_HOSTS=replica1,replica2
+# Each gets an alias "replicaN" that is otherwise configured like default.
+DATABASE_REPLICAS = []
+for (index, host) in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_HOSTS', '').split(','))):
+    alias = 'replica%d' % (index + 1)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip(),
+                            TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['needley.routers.ReplicaRouter']
+
+# Seconds a client that wrote keeps reading from the primary
+DATABASE_REPLICA_STICKINESS = int(os.environ.get('DATABASE_REPLICA_STICKINESS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Sessions, cached users and login rate limits live in 'default', and the
+# versions that invalidate cached responses in 'graphql'. Every process
+# serving the API (web workers and `run_tasks`) must see the same caches:
+# set MEMCACHED_LOCATION (host:port) whenever more than one process runs,
+# or a logout, password change, deactivation or recount only takes effect
+# in the process that made it. The LocMemCache fallback is per process and
+# only suits a single runserver (`manage.py check --deploy` warns about it).
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': MEMCACHED_LOCATION,
+    }
+    GRAPHQL_CACHE = dict(SHARED_CACHE, KEY_PREFIX='graphql')
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+    # LocMemCache evicts least recently used entries past MAX_ENTRIES.
+    GRAPHQL_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'graphql-responses',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    }
+
+CACHES = {
+    'default': SHARED_CACHE,
+    'graphql': dict(GRAPHQL_CACHE, TIMEOUT=60),
+    # Anyone can register persisted queries, so they get their own bounded
+    # cache rather than pushing sessions out of 'default'. It may be local
+    # to each process: clients resend the text of queries it lost.
+    'persisted-queries': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'graphql-persisted-queries',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+}
+
+# Cache alias used to store responses to anonymous GraphQL queries.
+# Set to None to disable the response cache.
+GRAPHQL_RESPONSE_CACHE = 'graphql'
+
+# Serializer of GraphQL responses (see needley/encoding.py): a dotted path
+# to a function returning JSON as UTF-8 bytes. fast_dumps uses orjson when
+# it is installed.
+GRAPHQL_JSON_SERIALIZER = 'needley.encoding.fast_dumps'
+
+# Responses of at least this many bytes are compressed with brotli (if the
+# `brotli` package is installed) or gzip, as negotiated with the client.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVELS = {
+    'br': 4,
+    'gzip': 6,
+}
+
+# Cache-Control of responses to GET queries, by operation name ('*' for the
+# rest). `no-cache` lets clients store responses but revalidate them with
+# If-None-Match every time; authenticated responses are always private.
+GRAPHQL_CACHE_CONTROL = {
+    '*': 'no-cache',
+}
+
+# Cache alias storing automatic persisted queries (sha256 -> query text).
+GRAPHQL_PERSISTED_QUERY_CACHE = 'persisted-queries'
+
+# Manifest written by `manage.py persist_queries`. When set, only the
+# documents listed in it are executed (e.g. in production).
+GRAPHQL_QUERY_ALLOWLIST = None
+
+# Number of parsed and validated documents kept in memory per process.
+GRAPHQL_DOCUMENT_CACHE_SIZE = 1000
+
 
 # Use custom User model in auth
 AUTH_USER_MODEL = 'needley.User'
 
+# Sessions and logged-in users are read from the cache so that resolving
+# request.user needs no queries (see needley/auth.py). Sessions are still
+# written through to the database. Both aliases must name a cache shared by
+# all processes (see CACHES above).
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'default'
+
+AUTHENTICATION_BACKENDS = ['needley.auth.CachedModelBackend']
+AUTH_USER_CACHE = 'default'
+AUTH_USER_CACHE_TIMEOUT = 300
+
+# New passwords are hashed with argon2. Older PBKDF2 hashes still verify and
+# are re-hashed with argon2 on the next successful login.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Password hashing runs in this many worker processes (0 hashes on the
+# request thread). Beyond PASSWORD_HASHING_QUEUE jobs in flight, sign-ins
+# wait up to PASSWORD_HASHING_TIMEOUT seconds and then fail (see
+# needley/passwords.py).
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 2))
+PASSWORD_HASHING_QUEUE = 32
+PASSWORD_HASHING_TIMEOUT = 5
+
+# Login attempts allowed per (attempts, seconds) window, by client address
+# and by username. The counters must be shared by all web workers (see
+# CACHES above).
+LOGIN_RATE_LIMITS = {
+    'ip': (30, 300),
+    'username': (10, 300),
+}
+LOGIN_RATE_LIMIT_CACHE = 'default'
+
+# Behind a load balancer every request comes from its address. Name the
+# request header (in request.META form, e.g. HTTP_X_FORWARDED_FOR) that the
+# proxies append the client address to, and how many proxies do so; the
+# address the outermost one saw is used (see passwords.client_ip).
+TRUSTED_PROXY_HEADER = os.environ.get('TRUSTED_PROXY_HEADER') or None
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 1))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -135,9 +288,76 @@ STATIC_URL = '/static/'
 
 GRAPHENE = {
     "SCHEMA": "needley.schema.schema",
-    "SCHEMA_OUTPUT": "specs/schema.graphql"
+    "SCHEMA_OUTPUT": "specs/schema.graphql",
+    # Largest page a connection may return (first/last above it are rejected)
+    "RELAY_CONNECTION_MAX_LIMIT": 100,
 }
 
+# Budgets enforced on every operation before execution (see needley/cost.py).
+# The computed cost is reported in the `extensions.cost` of each response.
+GRAPHQL_MAX_QUERY_DEPTH = 10
+GRAPHQL_MAX_QUERY_COST = 5000
+# Most articles accepted by one postArticles mutation.
+GRAPHQL_MAX_BATCH_SIZE = 100
+
+# Per-request profiling (see needley/profiling.py). Staff clients sending
+# the header get the profile in `extensions.profile`; this fraction of all
+# requests is traced to the needley.profiling logger.
+GRAPHQL_PROFILE_HEADER = 'HTTP_X_NEEDLEY_PROFILE'
+GRAPHQL_PROFILE_SAMPLE_RATE = float(
+    os.environ.get('NEEDLEY_PROFILE_SAMPLE_RATE', '0'))
+GRAPHQL_PROFILE_LOG = os.environ.get('NEEDLEY_PROFILE_LOG')
+
+if GRAPHQL_PROFILE_LOG:
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'trace': {'format': '%(message)s'},
+        },
+        'handlers': {
+            'profile': {
+                'class': 'logging.FileHandler',
+                'filename': GRAPHQL_PROFILE_LOG,
+                'formatter': 'trace',
+            },
+        },
+        'loggers': {
+            'needley.profiling': {
+                'handlers': ['profile'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        },
+    }
+
+# Who may read /metrics (see needley/metrics.py): clients connecting from
+# these networks (e.g. the Prometheus host, comma separated in
+# NEEDLEY_METRICS_NETWORKS), or sending `Authorization: Bearer` this token.
+METRICS_ALLOWED_NETWORKS = os.environ.get(
+    'NEEDLEY_METRICS_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+METRICS_TOKEN = os.environ.get('NEEDLEY_METRICS_TOKEN') or None
+
+# Background tasks (see needley/tasks.py): tasks claimed per worker batch,
+# seconds before a task claimed by a dead worker is requeued, and the
+# longest retry backoff.
+TASK_BATCH_SIZE = 100
+TASK_LOCK_TIMEOUT = 600
+TASK_MAX_BACKOFF = 3600
+
+# Broker fanning out subscription events (see needley/pubsub.py). The
+# in-memory broker only reaches subscribers connected to the same process.
+GRAPHQL_SUBSCRIPTION_BROKER = 'needley.pubsub.InMemoryBroker'
+
+# Where new article bodies are kept (see needley/content.py): 'inline' in
+# Article.content, or 'compressed' in the ArticleContent side table. Run
+# `manage.py backfill_articles` after changing it to move existing bodies.
+ARTICLE_CONTENT_STORAGE = os.environ.get('NEEDLEY_ARTICLE_CONTENT_STORAGE', 'inline')
+ARTICLE_CONTENT_COMPRESSION_LEVEL = 6
+
+# Serve /graphql with the coroutine view. asgi.py turns this on.
+GRAPHQL_ASYNC_VIEW = os.environ.get('NEEDLEY_ASYNC_GRAPHQL') == '1'
+
 
 # Store CSRF token in the user's session instead of in a cookie.
 CSRF_USE_COOKIE = True
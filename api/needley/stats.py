@@ -0,0 +1,79 @@
+"""Denormalized per-author statistics.
+
+`User.article_count` and `User.last_posted_at` are recounted in the
+background: saving a new article or deleting one queues
+`recompute_authors` in the same transaction as the write, so the recount
+runs once the write commits, and `manage.py run_tasks` recounts all the
+authors of a batch in one query. Bulk writes, which send no signals, must
+call `enqueue_recount` or `recompute` themselves; `manage.py
+recompute_author_stats` repairs any drift.
+
+Recounts run in `run_tasks`, so the caches they invalidate must be shared
+with the web workers (see CACHES in settings).
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from . import auth, cache, tasks
+from .models import Article
+
+User = get_user_model()
+
+
+def recompute(author_ids, using=None):
+    """Recount the articles of the given authors from the article table of
+    database `using` (the routers' choice by default).
+
+    Returns the number of authors whose statistics changed.
+    """
+    stats = {
+        row['author_id']: (row['count'], row['last'])
+        for row in Article.objects.using(using).filter(author_id__in=author_ids).order_by()
+        .values('author_id').annotate(count=Count('id'), last=Max('created_at'))
+    }
+
+    changed = []
+    now = timezone.now()
+    for user in User.objects.using(using).filter(pk__in=author_ids).only('article_count', 'last_posted_at'):
+        (count, last) = stats.get(user.pk, (0, None))
+        if (user.article_count, user.last_posted_at) != (count, last):
+            user.article_count = count
+            user.last_posted_at = last
+            user.updated_at = now
+            changed.append(user)
+
+    if changed:
+        User.objects.using(using).bulk_update(
+            changed, ['article_count', 'last_posted_at', 'updated_at'])
+        for user in changed:
+            auth.invalidate_user(user.pk, using=using)
+        cache.invalidate(User, using=using)
+    return len(changed)
+
+
+@tasks.task(batch=True)
+def recompute_authors(payloads):
+    recompute(sorted({payload['author_id'] for payload in payloads}))
+
+
+def enqueue_recount(author_ids):
+    for author_id in sorted(set(author_ids)):
+        tasks.enqueue(recompute_authors, author_id=author_id)
+
+
+def recount_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        enqueue_recount([instance.author_id])
+
+
+def recount_on_delete(sender, instance, **kwargs):
+    enqueue_recount([instance.author_id])
+
+
+def connect_signals():
+    post_save.connect(recount_on_save, sender=Article,
+                      dispatch_uid='author-stats-save')
+    post_delete.connect(recount_on_delete, sender=Article,
+                        dispatch_uid='author-stats-delete')
@@ -0,0 +1,161 @@
+"""GraphQL subscriptions over WebSocket.
+
+`application` is the ASGI app for WebSocket connections to /graphql (see
+asgi.py). It speaks the `graphql-transport-ws` protocol of the `graphql-ws`
+client library: connection_init/connection_ack, ping/pong, then any number
+of subscribe/next/error/complete exchanges keyed by operation id.
+
+Only subscription operations are served here; queries and mutations stay
+on the HTTP view. Events come from the broker in needley/pubsub.py and are
+resolved without touching the database.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+from graphql import ExecutionResult, GraphQLError, OperationType, get_operation_ast, subscribe
+
+from . import cost, encoding
+from .documents import get_document
+from .schema import schema
+
+PROTOCOL = 'graphql-transport-ws'
+PATH = '/graphql'
+
+# Close codes defined by the protocol.
+BAD_REQUEST = 4400
+UNAUTHORIZED = 4401
+SUBPROTOCOL_NOT_ACCEPTABLE = 4406
+SUBSCRIBER_EXISTS = 4409
+TOO_MANY_INIT_REQUESTS = 4429
+
+
+class GraphQLWebSocket:
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.acknowledged = False
+        self.operations = {}
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if self.scope['path'].rstrip('/') != PATH:
+            await self.close()
+            return
+        if PROTOCOL not in self.scope.get('subprotocols', ()):
+            await self.close(SUBPROTOCOL_NOT_ACCEPTABLE)
+            return
+        await self.send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    return
+                if message['type'] != 'websocket.receive':
+                    continue
+                try:
+                    data = json.loads(message.get('text') or message.get('bytes'))
+                    if not isinstance(data, dict):
+                        raise ValueError(data)
+                except (TypeError, ValueError):
+                    await self.close(BAD_REQUEST)
+                    return
+                if not await self.handle(data):
+                    return
+        finally:
+            for task in self.operations.values():
+                task.cancel()
+
+    async def handle(self, message):
+        """Handle a client message; return False once the socket is closed."""
+        type = message.get('type')
+        if type == 'connection_init':
+            if self.acknowledged:
+                await self.close(TOO_MANY_INIT_REQUESTS)
+                return False
+            self.acknowledged = True
+            await self.send_json({'type': 'connection_ack'})
+        elif type == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif type == 'pong':
+            pass
+        elif type == 'subscribe':
+            id = message.get('id')
+            if not self.acknowledged:
+                await self.close(UNAUTHORIZED)
+                return False
+            if not isinstance(id, str) or not isinstance(message.get('payload'), dict):
+                await self.close(BAD_REQUEST)
+                return False
+            if id in self.operations:
+                await self.close(SUBSCRIBER_EXISTS)
+                return False
+            self.operations[id] = asyncio.ensure_future(
+                self.run_operation(id, message['payload']))
+        elif type == 'complete':
+            task = self.operations.pop(message.get('id'), None)
+            if task is not None:
+                task.cancel()
+        else:
+            await self.close(BAD_REQUEST)
+            return False
+        return True
+
+    async def run_operation(self, id, payload):
+        try:
+            result = await self.subscribe(payload)
+            if isinstance(result, ExecutionResult):
+                await self.send_json({'id': id, 'type': 'error', 'payload': [
+                    error.formatted for error in result.errors]})
+                return
+
+            try:
+                async for event in result:
+                    await self.send_json({'id': id, 'type': 'next', 'payload': event.formatted})
+            finally:
+                await result.aclose()
+            await self.send_json({'id': id, 'type': 'complete'})
+        finally:
+            if self.operations.get(id) is asyncio.current_task():
+                del self.operations[id]
+
+    async def subscribe(self, payload):
+        graphql_schema = schema.graphql_schema
+        try:
+            document, validation_errors = get_document(
+                graphql_schema, payload.get('query') or '')
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+        if validation_errors:
+            return ExecutionResult(errors=list(validation_errors))
+
+        operation_name = payload.get('operationName')
+        variables = payload.get('variables')
+        operation_ast = get_operation_ast(document, operation_name)
+        if operation_ast is None or operation_ast.operation != OperationType.SUBSCRIPTION:
+            return ExecutionResult(errors=[GraphQLError(
+                'Only subscriptions are served over WebSocket.')])
+
+        cost_errors = cost.check_limits(cost.analyze(
+            graphql_schema, document, operation_name, variables))
+        if cost_errors:
+            return ExecutionResult(errors=cost_errors)
+
+        return await subscribe(
+            graphql_schema, document,
+            context_value=SimpleNamespace(scope=self.scope),
+            variable_values=variables, operation_name=operation_name)
+
+    async def send_json(self, message):
+        await self.send({'type': 'websocket.send', 'text': encoding.dumps(message).decode('utf-8')})
+
+    async def close(self, code=1000):
+        await self.send({'type': 'websocket.close', 'code': code})
+
+
+async def application(scope, receive, send):
+    await GraphQLWebSocket(scope, receive, send).run()
@@ -0,0 +1,166 @@
+"""Database-backed background tasks.
+
+Register a function with `@task` and queue it with `enqueue(fn, **payload)`.
+The task row is inserted in the caller's transaction, so it runs if and
+only if the write that caused it commits, and the mutation does not wait
+for it. `manage.py run_tasks` workers claim queued rows (with SKIP LOCKED
+on PostgreSQL, so any number of workers can run), delete them once they
+succeed, and retry failures with exponential backoff up to
+`max_attempts` before marking them failed.
+
+Tasks registered with `batch=True` receive a list of payloads: up to
+TASK_BATCH_SIZE queued tasks of the same name are run in one call, e.g.
+to recompute statistics for many authors in a single query.
+"""
+import logging
+import time
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class RegisteredTask:
+    def __init__(self, fn, name, max_attempts, batch):
+        self.fn = fn
+        self.name = name
+        self.max_attempts = max_attempts
+        self.batch = batch
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+
+def task(name=None, max_attempts=5, batch=False):
+    def register(fn):
+        registered = RegisteredTask(
+            fn, name or '%s.%s' % (fn.__module__, fn.__name__), max_attempts, batch)
+        registry[registered.name] = registered
+        return registered
+    return register
+
+
+def get_task(name):
+    if name not in registry:
+        # Tasks register when their module is imported, and are named after
+        # it by default.
+        try:
+            import_module(name.rpartition('.')[0])
+        except ImportError:
+            pass
+    return registry.get(name)
+
+
+def enqueue(task, **payload):
+    return Task.objects.create(name=task.name, payload=payload)
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, getattr(settings, 'TASK_MAX_BACKOFF', 3600)))
+
+
+def requeue_stale():
+    """Requeue tasks claimed by workers that died before finishing them."""
+    cutoff = timezone.now() - timedelta(
+        seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 600))
+    return Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff).update(
+        status=Task.QUEUED, locked_at=None)
+
+
+def claim(limit):
+    with transaction.atomic():
+        tasks = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.QUEUED, run_at__lte=timezone.now())
+            .order_by('run_at', 'id')[:limit])
+        if tasks:
+            Task.objects.filter(id__in=[t.id for t in tasks]).update(
+                status=Task.RUNNING, locked_at=timezone.now())
+    return tasks
+
+
+def run_pending(limit=None):
+    """Claim and run up to `limit` due tasks; return how many were claimed."""
+    limit = limit or getattr(settings, 'TASK_BATCH_SIZE', 100)
+    tasks = claim(limit)
+
+    by_name = defaultdict(list)
+    for claimed in tasks:
+        by_name[claimed.name].append(claimed)
+
+    for (name, group) in by_name.items():
+        registered = get_task(name)
+        if registered is None:
+            fail(group, None, 'Unknown task: %s' % name)
+        elif registered.batch:
+            execute(registered, group)
+        else:
+            for claimed in group:
+                execute(registered, [claimed])
+    return len(tasks)
+
+
+def execute(registered, group):
+    started = time.perf_counter()
+    try:
+        with transaction.atomic():
+            if registered.batch:
+                registered([claimed.payload for claimed in group])
+            else:
+                registered(**group[0].payload)
+    except Exception:
+        logger.exception('Task %s failed', registered.name)
+        fail(group, registered, traceback.format_exc())
+    else:
+        Task.objects.filter(id__in=[claimed.id for claimed in group]).delete()
+        metrics.tasks_processed.labels(registered.name, 'succeeded').inc(len(group))
+    finally:
+        metrics.task_duration.labels(registered.name).observe(
+            time.perf_counter() - started)
+
+
+def fail(group, registered, error):
+    max_attempts = registered.max_attempts if registered else 1
+    name = registered.name if registered else group[0].name
+    for claimed in group:
+        claimed.attempts += 1
+        claimed.last_error = error
+        claimed.locked_at = None
+        if claimed.attempts >= max_attempts:
+            claimed.status = Task.FAILED
+            metrics.tasks_processed.labels(name, 'failed').inc()
+        else:
+            claimed.status = Task.QUEUED
+            claimed.run_at = timezone.now() + backoff(claimed.attempts)
+            metrics.tasks_processed.labels(name, 'retried').inc()
+        claimed.save(update_fields=[
+                     'attempts', 'last_error', 'locked_at', 'status', 'run_at'])
+
+
+def queue_depths():
+    """Return `{(name, status): count}` of the tasks in the queue."""
+    rows = Task.objects.order_by().values(
+        'name', 'status').annotate(count=Count('id'))
+    return {(row['name'], row['status']): row['count'] for row in rows}
+
+
+def update_queue_metrics():
+    depths = queue_depths()
+    # Report zero for drained queues instead of their last depth.
+    names = set(registry) | {name for (name, _) in depths}
+    for name in names:
+        for (status, _) in Task.STATUS_CHOICES:
+            metrics.task_queue.labels(name, status).set(
+                depths.get((name, status), 0))
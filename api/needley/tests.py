@@ -1,17 +1,54 @@
+import asyncio
+import csv
+import gzip
+import io
 import json
 import datetime
+import os
+import tempfile
+import threading
+import time
 from dataclasses import dataclass
+from unittest import mock
 from unittest.signals import removeResult
 
-from django.test import Client, TestCase
+from django.core.cache import caches
+from django.core.cache.backends.base import memcache_key_warnings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, SimpleTestCase, TestCase, override_settings
+from django.urls import path
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from prometheus_client import REGISTRY
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 import graphene
 from graphene.test import Client as GraphQLClient
 from graphql_relay import to_global_id
 
-from .models import Article
-from .schema import schema, UserNode
+from . import encoding, stats
+from .export import export_rows
+from .loaders import Loaders
+from .models import Article, ArticleContent, Task
+from .auth import check_shared_caches
+from .benchmarks import bench_users
+from .backends.pool import ConnectionPool, PoolTimeout
+from .backends.postgresql.base import pools
+from .passwords import HashingPool, PasswordHashingBusy, hash_password
+from .persisted import query_hash
+from .routers import (STICKY_COOKIE, ReplicaRouter, read_from_replicas,
+                      request_routing)
+from .views import AsyncGraphQLView
+from .pubsub import InMemoryBroker
+from .schema import ArticleNode, publish_article, schema, UserNode
+from .subscriptions import application as websocket_application
+from .tasks import enqueue, run_pending, task
 
 User = get_user_model()
 
@@ -26,6 +63,8 @@ def post_query(query, login_as=None):
 
     response = client.post('/graphql', {'query': query})
     parsed = json.loads(response.content)
+    # Query cost is covered by QueryCostTests
+    parsed.pop('extensions', None)
     return parsed
 
 
@@ -482,3 +521,1478 @@ class PostArticleTests(TestCase):
         result = post_query(query)
 
         self.assertEqual(result, expect)
+
+
+def count_queries(query, login_as=None):
+    with CaptureQueriesContext(connection) as context:
+        result = post_query(query, login_as=login_as)
+    return (result, len(context.captured_queries))
+
+
+class BatchLoadTests(TestCase):
+    query = '''
+        {
+            allArticles {
+                edges {
+                    node {
+                        title
+                        author {
+                            nickname
+                        }
+                    }
+                }
+            }
+        }
+    '''
+
+    def create_articles(self, count):
+        for idx in range(count):
+            author = get_mock_user()
+            Article.objects.create(
+                title=f'title {idx}', content='content', author=author)
+
+    def test_author_nickname(self):
+        self.create_articles(3)
+        result, _ = count_queries(self.query)
+
+        expect = [
+            {'title': article.title,
+                'author': {'nickname': article.author.nickname}}
+            for article in Article.objects.all()
+        ]
+        nodes = [edge['node']
+                 for edge in result['data']['allArticles']['edges']]
+
+        self.assertEqual(nodes, expect)
+
+    def test_constant_query_count(self):
+        self.create_articles(2)
+        _, small = count_queries(self.query)
+
+        self.create_articles(10)
+        _, large = count_queries(self.query)
+
+        self.assertEqual(small, large)
+
+    def test_users_loader(self):
+        self.create_articles(3)
+        ids = list(Article.objects.values_list('author_id', flat=True))
+        loaders = Loaders()
+        with CaptureQueriesContext(connection) as context:
+            users = loaders.users.load_many(ids + [0])
+            loaders.users.load(ids[0])
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual([user.id for user in users[:-1]], ids)
+        self.assertIsNone(users[-1])
+
+    def test_author_of_unprojected_articles(self):
+        # Articles loaded without the projection do not join their author,
+        # so resolving it goes through the users loader.
+        self.create_articles(3)
+        articles = list(Article.objects.all())
+        info = mock.Mock(context=mock.Mock(loaders=Loaders()))
+        with CaptureQueriesContext(connection) as context:
+            ArticleNode.batch_load(info, articles)
+            authors = [ArticleNode.resolve_author(article, info) for article in articles]
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual([author.id for author in authors],
+                         [article.author_id for article in articles])
+
+
+def recent_articles_query(args):
+    return f'''
+        {{
+            recentArticles{args} {{
+                edges {{
+                    node {{
+                        title
+                    }}
+                }}
+                pageInfo {{
+                    hasNextPage
+                    hasPreviousPage
+                    startCursor
+                    endCursor
+                }}
+            }}
+        }}
+    '''
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        author = get_mock_user()
+        for idx in range(5):
+            Article.objects.create(
+                title=f'title {idx}', content='content', author=author)
+        # newest first
+        self.titles = [f'title {idx}' for idx in reversed(range(5))]
+
+    def titles_of(self, result):
+        return [edge['node']['title']
+                for edge in result['data']['recentArticles']['edges']]
+
+    def test_page_forward(self):
+        titles = []
+        after = ''
+        while True:
+            result = post_query(recent_articles_query(f'(first: 2{after})'))
+            titles += self.titles_of(result)
+            page_info = result['data']['recentArticles']['pageInfo']
+            if not page_info['hasNextPage']:
+                break
+            after = f', after: "{page_info["endCursor"]}"'
+
+        self.assertEqual(titles, self.titles)
+
+    def test_page_backward(self):
+        result = post_query(recent_articles_query('(last: 2)'))
+        self.assertEqual(self.titles_of(result), self.titles[-2:])
+
+        start = result['data']['recentArticles']['pageInfo']['startCursor']
+        result = post_query(recent_articles_query(
+            f'(last: 2, before: "{start}")'))
+        self.assertEqual(self.titles_of(result), self.titles[1:3])
+        self.assertTrue(
+            result['data']['recentArticles']['pageInfo']['hasPreviousPage'])
+
+    def test_total_count_only_when_selected(self):
+        with CaptureQueriesContext(connection) as context:
+            post_query(recent_articles_query('(first: 2)'))
+        sqls = [query['sql'] for query in context.captured_queries]
+        self.assertFalse(any('COUNT(' in sql for sql in sqls))
+
+        result = post_query(
+            '{ recentArticles(first: 2, title_Icontains: "title") { totalCount } }')
+        self.assertEqual(result['data']['recentArticles']['totalCount'], 5)
+
+    def test_invalid_cursor(self):
+        result = post_query(recent_articles_query('(after: "invalid")'))
+        self.assertIn('errors', result)
+
+    def test_recent_users(self):
+        users = [get_mock_user() for count in range(3)]
+        result = post_query(
+            '{ recentUsers(first: 2) { edges { node { username } } } }')
+        usernames = [edge['node']['username']
+                     for edge in result['data']['recentUsers']['edges']]
+        self.assertEqual(usernames, [users[2].username, users[1].username])
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        caches['graphql'].clear()
+        author = get_mock_user()
+        for idx in range(3):
+            Article.objects.create(
+                title=f'title {idx}', content='secret content', author=author)
+
+    def sqls_of(self, query):
+        with CaptureQueriesContext(connection) as context:
+            result = post_query(query)
+        self.assertNotIn('errors', result)
+        return [query['sql'] for query in context.captured_queries]
+
+    def test_list_skips_content(self):
+        sqls = self.sqls_of(
+            '{ allArticles { edges { node { title createdAt } } } }')
+        # The page and its count, without per-row deferred loads
+        self.assertEqual(len(sqls), 2)
+        self.assertFalse(any('"content"' in sql for sql in sqls))
+
+        sqls = self.sqls_of(
+            '{ allArticles { edges { node { title content } } } }')
+        self.assertTrue(any('"content"' in sql for sql in sqls))
+
+    def test_keyset_pages_skip_content(self):
+        result = post_query(recent_articles_query('(first: 2)'))
+        after = result['data']['recentArticles']['pageInfo']['endCursor']
+
+        sqls = self.sqls_of(recent_articles_query(f'(first: 2, after: "{after}")'))
+        self.assertEqual(len(sqls), 1)
+        self.assertNotIn('"content"', sqls[0])
+
+    def test_fragments(self):
+        sqls = self.sqls_of('''
+            { allArticles { edges { node { ...Summary } } } }
+            fragment Summary on ArticleNode { title author { nickname } }
+        ''')
+        # The author is joined, and neither content nor passwords are read.
+        self.assertEqual(len(sqls), 2)
+        self.assertFalse(any('"content"' in sql for sql in sqls))
+        self.assertFalse(any('"password"' in sql for sql in sqls))
+
+    def test_users_skip_password(self):
+        sqls = self.sqls_of('{ allUsers { edges { node { username } } } }')
+        self.assertFalse(any('"password"' in sql for sql in sqls))
+
+
+class SearchArticlesTests(TestCase):
+    def test_search_articles(self):
+        author = get_mock_user()
+        titles = ['graphql tips', 'react hooks', 'django and graphql']
+        for title in titles:
+            Article.objects.create(title=title, content='body', author=author)
+
+        result = post_query(
+            '{ searchArticles(query: "graphql") { edges { node { title } } } }')
+        found = [edge['node']['title']
+                 for edge in result['data']['searchArticles']['edges']]
+
+        self.assertEqual(sorted(found), ['django and graphql', 'graphql tips'])
+
+
+class ExplainFiltersTests(TestCase):
+    def test_explain_filters(self):
+        Article.objects.create(
+            title='title', content='content', author=get_mock_user())
+        out = io.StringIO()
+        call_command('explain_filters', stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('author + created_at__lt', output)
+        self.assertIn('article_author_created_idx', output)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['graphql'].clear()
+        self.author = get_mock_user()
+        Article.objects.create(
+            title='title', content='content', author=self.author)
+
+    def test_anonymous_query_is_cached(self):
+        data = all_articles_query()
+        result, _ = count_queries(data['query'])
+        cached, queries = count_queries(data['query'])
+
+        self.assertEqual(cached, data['expect'])
+        self.assertEqual(queries, 0)
+
+    def test_post_article_invalidates(self):
+        post_query(all_articles_query()['query'])
+        post_query(post_article_mutation('new', 'new content')['mutation'],
+                   login_as=self.author)
+
+        data = all_articles_query()
+        result = post_query(data['query'])
+
+        self.assertEqual(result, data['expect'])
+        self.assertEqual(len(result['data']['allArticles']['edges']), 2)
+
+    def test_unrelated_write_keeps_entry(self):
+        query = all_articles_query()['query']
+        post_query(query)
+        _, queries = count_queries(query)
+        self.assertEqual(queries, 0)
+
+        # allArticles above does not select any user field
+        get_mock_user()
+        _, queries = count_queries(query)
+        self.assertEqual(queries, 0)
+
+    def test_authenticated_query_is_not_cached(self):
+        query = all_articles_query()['query']
+        count_queries(query, login_as=self.author)
+        _, queries = count_queries(query, login_as=self.author)
+
+        self.assertGreater(queries, 0)
+
+    def test_me_is_not_cached(self):
+        query = '{ me { ok } allArticles { edges { node { title } } } }'
+        post_query(query)
+        _, queries = count_queries(query)
+
+        self.assertGreater(queries, 0)
+
+
+def post_json(body, login_as=None):
+    client = Client()
+    if login_as:
+        client.force_login(login_as)
+
+    response = client.post('/graphql', json.dumps(body),
+                           content_type='application/json')
+    parsed = json.loads(response.content)
+    parsed.pop('extensions', None)
+    return parsed
+
+
+def persisted_query_body(query, with_query=True):
+    body = {
+        'extensions': {
+            'persistedQuery': {'version': 1, 'sha256Hash': query_hash(query)},
+        },
+    }
+    if with_query:
+        body['query'] = query
+    return body
+
+
+class PersistedQueryTests(TestCase):
+    query = '{ allUsers { edges { node { username } } } }'
+
+    def setUp(self):
+        caches['persisted-queries'].clear()
+        caches['graphql'].clear()
+        self.user = get_mock_user()
+        self.expect = {'data': {'allUsers': {'edges': [
+            {'node': {'username': self.user.username}}]}}}
+
+    def test_register_and_run(self):
+        result = post_json(persisted_query_body(self.query, with_query=False))
+        self.assertEqual(result['errors'][0]['message'],
+                         'PersistedQueryNotFound')
+
+        result = post_json(persisted_query_body(self.query))
+        self.assertEqual(result, self.expect)
+
+        result = post_json(persisted_query_body(self.query, with_query=False))
+        self.assertEqual(result, self.expect)
+
+    def test_own_cache(self):
+        post_json(persisted_query_body(self.query))
+
+        key = 'graphql-persisted:%s' % query_hash(self.query)
+        self.assertEqual(caches['persisted-queries'].get(key), self.query)
+        self.assertIsNone(caches['default'].get(key))
+
+    def test_hash_mismatch(self):
+        body = persisted_query_body(self.query)
+        body['query'] = '{ allArticles { edges { node { title } } } }'
+        result = post_json(body)
+
+        self.assertIn('errors', result)
+
+    def test_allowlist(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({query_hash(self.query): self.query}, f)
+            f.flush()
+
+            with override_settings(GRAPHQL_QUERY_ALLOWLIST=f.name):
+                result = post_json(
+                    persisted_query_body(self.query, with_query=False))
+                self.assertEqual(result, self.expect)
+
+                result = post_json({'query': self.query})
+                self.assertEqual(result, self.expect)
+
+                result = post_json({'query': '{ me { ok } }'})
+                self.assertEqual(result['errors'][0]['message'],
+                                 'PersistedQueryNotAllowed')
+
+
+class QueryCostTests(TestCase):
+    query = '''
+        query ($first: Int) {
+            allArticles(first: $first) {
+                edges {
+                    node {
+                        title
+                        author {
+                            nickname
+                        }
+                    }
+                }
+            }
+        }
+    '''
+
+    def setUp(self):
+        caches['graphql'].clear()
+
+    def post(self, first):
+        response = Client().post('/graphql', json.dumps({'query': self.query, 'variables': {'first': first}}),
+                                 content_type='application/json')
+        return json.loads(response.content)
+
+    def test_cost_in_extensions(self):
+        result = self.post(10)
+
+        # allArticles + 10 * (edges + node + author)
+        self.assertEqual(result['extensions']['cost']['requested'], 31)
+        self.assertEqual(result['extensions']['cost']['depth'], 5)
+
+        # An empty page, not the default page size
+        self.assertEqual(self.post(0)['extensions']['cost']['requested'], 1)
+        self.assertEqual(self.post(None)['extensions']['cost']['requested'], 301)
+
+    @override_settings(GRAPHQL_MAX_QUERY_COST=100)
+    def test_max_cost(self):
+        self.assertNotIn('errors', self.post(10))
+
+        result = self.post(50)
+        self.assertNotIn('data', result)
+        self.assertIn('exceeds the maximum cost', result['errors'][0]['message'])
+
+    @override_settings(GRAPHQL_MAX_QUERY_DEPTH=4)
+    def test_max_depth(self):
+        result = self.post(10)
+
+        self.assertIn('exceeds the maximum depth', result['errors'][0]['message'])
+
+    def test_page_size_cap(self):
+        result = self.post(1000)
+
+        self.assertIsNone(result['data']['allArticles'])
+        self.assertIn('exceeds the `first` limit', result['errors'][0]['message'])
+
+
+class AsyncGraphQLViewTests(TestCase):
+    def setUp(self):
+        caches['graphql'].clear()
+        self.user = get_mock_user()
+
+    async def test_async_view(self):
+        view = AsyncGraphQLView.as_view(thread_sensitive=True)
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+
+        request = AsyncRequestFactory().post(
+            '/graphql', json.dumps({'query': '{ allUsers { edges { node { username } } } }'}),
+            content_type='application/json')
+        request.user = AnonymousUser()
+        response = await view(request)
+
+        result = json.loads(response.content)
+        self.assertEqual(result['data'], {'allUsers': {'edges': [
+            {'node': {'username': self.user.username}}]}})
+
+
+async def sleeping_view(request):
+    await asyncio.sleep(0.5)
+    return HttpResponse('slept')
+
+
+urlpatterns = [path('sleep', sleeping_view)]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncMiddlewareTests(SimpleTestCase):
+    async def get(self, handler):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/sleep', 'query_string': b'',
+                 'headers': [], 'server': ('testserver', 80)}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        await handler(scope, receive, send)
+        return messages
+
+    async def test_concurrent_requests(self):
+        # Like Django's test clients, keep the test database connection open.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            handler = ASGIHandler()
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[self.get(handler) for _ in range(5)])
+            elapsed = time.perf_counter() - started
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+        for messages in responses:
+            self.assertEqual(messages[0]['status'], 200)
+        # Five half-second sleeps overlap instead of running one at a time.
+        self.assertLess(elapsed, 1.5)
+
+
+class FakeConnection:
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    def test_reuse(self):
+        pool = ConnectionPool(FakeConnection, max_size=2, timeout=1)
+        conn = pool.getconn()
+        pool.putconn(conn)
+
+        self.assertIs(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_timeout(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.01)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_discard(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.01)
+        conn = pool.getconn()
+        pool.discard(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.getconn(), conn)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_queries_read_from_replicas(self):
+        with request_routing():
+            self.assertEqual(self.router.db_for_read(Article), 'default')
+            with read_from_replicas():
+                replica = self.router.db_for_read(Article)
+                self.assertIn(replica, ['replica1', 'replica2'])
+                # The whole request reads from the same replica.
+                self.assertEqual({self.router.db_for_read(Article) for _ in range(20)},
+                                 {replica})
+            self.assertEqual(self.router.db_for_write(Article), 'default')
+
+    def test_pinned_reads_stay_on_primary(self):
+        with request_routing(pinned=True):
+            with read_from_replicas():
+                self.assertEqual(self.router.db_for_read(Article), 'default')
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'needley'))
+        self.assertIsNone(self.router.allow_migrate('default', 'needley'))
+
+
+
+class StickyPrimaryTests(TestCase):
+    def test_write_pins_client_to_primary(self):
+        client = Client()
+        response = client.post(
+            '/graphql', {'query': '{ allUsers { totalCount } }'})
+        self.assertEqual(json.loads(response.content)['data'],
+                         {'allUsers': {'totalCount': 0}})
+        self.assertNotIn(STICKY_COOKIE, client.cookies)
+
+        u = get_mock_user(data_only=True)
+        client.post('/graphql', {'query': create_user_mutation(
+            u.username, u.email, u.password, u.nickname)['mutation']})
+        self.assertIn(STICKY_COOKIE, client.cookies)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_benchmark(self):
+        # Shares the prefix but is not a seeded user.
+        User.objects.create_user(username='benchmark', email='benchmark@example.com',
+                                 password='password', nickname='benchmark')
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as f:
+            call_command('benchmark', users=3, articles=10, repeat=2,
+                         json_path=f.name, stdout=io.StringIO())
+            results = json.load(f)['results']
+
+        self.assertIn('postArticle', results)
+        self.assertEqual(sorted(bench_users().values_list('username', flat=True)),
+                         ['bench0', 'bench1', 'bench2'])
+        # allArticles joined with its authors, and its count
+        self.assertEqual(results['allArticles']['queries'], 2)
+
+
+class ImportArticlesTests(TestCase):
+    def write(self, suffix, content):
+        f = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        self.addCleanup(os.remove, f.name)
+        with f:
+            f.write(content)
+        return f.name
+
+    def test_import(self):
+        users = self.write('.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'username': 'alice', 'email': 'alice@example.com',
+                'nickname': 'Alice', 'password': 'secret'},
+            {'username': 'bob', 'email': 'bob@example.com', 'nickname': 'Bob',
+                'password_hash': make_password('hunter2')},
+        ]))
+        articles = self.write('.csv', 'author,title,content,created_at\n' + ''.join(
+            'alice,Title %d,Content %d,2020-01-0%dT00:00:00+00:00\n' % (i, i, i + 1) for i in range(5)))
+
+        call_command('import_articles', articles, users=users, batch_size=2,
+                     processes=1, stdout=io.StringIO())
+
+        self.assertTrue(User.objects.get(
+            username='alice').check_password('secret'))
+        self.assertTrue(User.objects.get(
+            username='bob').check_password('hunter2'))
+        self.assertEqual(Article.objects.filter(
+            author__username='alice').count(), 5)
+
+        # Users that already exist are skipped, so loads can be re-run.
+        call_command('import_articles', users=users,
+                     processes=1, stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_unknown_author(self):
+        articles = self.write('.jsonl', json.dumps(
+            {'author': 'nobody', 'title': 'Title', 'content': 'Content'}))
+
+        with self.assertRaises(CommandError):
+            call_command('import_articles', articles, stdout=io.StringIO())
+        self.assertFalse(Article.objects.exists())
+
+    def test_statistics_use_database(self):
+        author = get_mock_user()
+        articles = self.write('.jsonl', json.dumps(
+            {'author': author.username, 'title': 'Title', 'content': 'Content'}))
+
+        with mock.patch.object(stats, 'recompute', wraps=stats.recompute) as recompute:
+            call_command('import_articles', articles, database='default', stdout=io.StringIO())
+
+        recompute.assert_called_once_with([author.id], using='default')
+        author.refresh_from_db()
+        self.assertEqual(author.article_count, 1)
+
+
+class ExportArticlesTests(TestCase):
+    def setUp(self):
+        self.author = get_mock_user()
+        for idx in range(5):
+            Article.objects.create(
+                title=f'title {idx}', content='content, "quoted"', author=self.author)
+
+    def export(self, **params):
+        client = Client()
+        client.force_login(self.author)
+        response = client.get('/export/articles', params)
+        return b''.join(response.streaming_content).decode()
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+
+        self.assertEqual([row['title'] for row in rows],
+                         [f'title {idx}' for idx in range(5)])
+        self.assertEqual(rows[0]['author_username'], self.author.username)
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export(format='csv'))))
+
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['content'], 'content, "quoted"')
+
+    def test_resume(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        checkpoint = '%s,%d' % (rows[1]['created_at'], rows[1]['id'])
+
+        resumed = [json.loads(line)
+                   for line in self.export(after=checkpoint).splitlines()]
+        self.assertEqual(resumed, rows[2:])
+
+    def test_gzip(self):
+        client = Client()
+        client.force_login(self.author)
+        response = client.get('/export/articles', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 5)
+
+    def test_requires_login(self):
+        self.assertEqual(Client().get('/export/articles').status_code, 401)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.jsonl.gz') as f:
+            call_command('export_articles', output=f.name,
+                         gzip=True, chunk_size=2)
+            lines = gzip.decompress(f.read()).splitlines()
+
+        self.assertEqual(len(lines), 5)
+
+
+class ProfilingTests(TestCase):
+    query = BatchLoadTests.query
+
+    def setUp(self):
+        caches['graphql'].clear()
+        BatchLoadTests.create_articles(self, 3)
+
+    def post(self, login_as=None, **headers):
+        client = Client()
+        if login_as:
+            client.force_login(login_as)
+        response = client.post('/graphql', {'query': self.query}, **headers)
+        return json.loads(response.content)
+
+    def test_profile_extension(self):
+        staff = get_mock_user()
+        staff.is_staff = True
+        staff.save()
+
+        result = self.post(login_as=staff, HTTP_X_NEEDLEY_PROFILE='1')
+        profile = result['extensions']['profile']
+
+        # allArticles joined with its authors, and its count
+        self.assertEqual(profile['sql']['count'], 2)
+        self.assertEqual(profile['sql']['duplicates'], [])
+        self.assertIn('Query.allArticles', [
+            resolver['field'] for resolver in profile['resolvers']])
+        self.assertEqual(set(profile['phases']), {'parse', 'cost', 'execute'})
+
+    def test_profile_requires_staff(self):
+        result = self.post(login_as=get_mock_user(),
+                           HTTP_X_NEEDLEY_PROFILE='1')
+        self.assertNotIn('profile', result['extensions'])
+
+        result = self.post(HTTP_X_NEEDLEY_PROFILE='1')
+        self.assertNotIn('profile', result['extensions'])
+
+    @override_settings(GRAPHQL_PROFILE_SAMPLE_RATE=1)
+    def test_sampled_trace(self):
+        with self.assertLogs('needley.profiling') as logs:
+            result = self.post()
+
+        self.assertNotIn('profile', result['extensions'])
+        trace = json.loads(logs.records[0].getMessage())
+        self.assertEqual(trace['path'], '/graphql')
+        self.assertIn('Query.allArticles;SQL', trace['stacks'])
+        self.assertIn('Query.allArticles;ArticleNodeConnection.edges;ArticleNodeEdge.node;ArticleNode.author;MeUserNode.nickname',
+                      trace['stacks'])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        caches['graphql'].clear()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_operation_histogram(self):
+        labels = {'operation_type': 'query', 'operation': 'allArticles'}
+        before = self.sample(
+            'graphql_operation_duration_seconds_count', **labels)
+
+        post_query(BatchLoadTests.query)
+
+        self.assertEqual(self.sample(
+            'graphql_operation_duration_seconds_count', **labels), before + 1)
+        response = Client().get('/metrics')
+        self.assertIn(b'graphql_operation_db_seconds_bucket{',
+                      response.content)
+
+    def test_cache_lookups(self):
+        misses = self.sample(
+            'graphql_response_cache_requests_total', result='miss')
+        hits = self.sample(
+            'graphql_response_cache_requests_total', result='hit')
+
+        post_query(BatchLoadTests.query)
+        post_query(BatchLoadTests.query)
+
+        self.assertEqual(self.sample(
+            'graphql_response_cache_requests_total', result='miss'), misses + 1)
+        self.assertEqual(self.sample(
+            'graphql_response_cache_requests_total', result='hit'), hits + 1)
+
+    def test_login_failures(self):
+        user = get_mock_user()
+        before = self.sample('login_attempts_total', result='failure')
+
+        post_query(login_mutation(user.username, 'wrong'))
+
+        self.assertEqual(self.sample(
+            'login_attempts_total', result='failure'), before + 1)
+
+    def test_pool_stats(self):
+        pool = ConnectionPool(FakeConnection, max_size=2, timeout=1)
+        pool.putconn(pool.getconn())
+        pool.getconn()
+
+        with mock.patch.dict(pools, {'metrics-test': pool}):
+            Client().get('/metrics')
+            Client().get('/metrics')
+
+        self.assertEqual(self.sample('db_pool_checkouts_total',
+                         database='metrics-test'), 2)
+        self.assertEqual(self.sample('db_pool_connections',
+                         database='metrics-test', state='in_use'), 1)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_restricted(self):
+        self.assertEqual(Client().get('/metrics').status_code, 200)
+        client = Client(REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                         403)
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code,
+                         200)
+
+
+class CachedAuthenticationTests(TestCase):
+    query = '{ me { user { username nickname } ok } }'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(
+            username='cached', email='cached@example.com', password='password', nickname='before')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def post(self):
+        response = self.client.post('/graphql', {'query': self.query})
+        return json.loads(response.content)['data']['me']
+
+    def test_no_queries(self):
+        self.post()
+
+        with CaptureQueriesContext(connection) as queries:
+            me = self.post()
+
+        self.assertEqual(me['user']['username'], 'cached')
+        self.assertEqual(len(queries), 0)
+
+    def test_profile_change(self):
+        self.post()
+        self.user.nickname = 'after'
+        self.user.save()
+
+        self.assertEqual(self.post()['user']['nickname'], 'after')
+
+    def test_password_change(self):
+        self.post()
+        self.user.set_password('changed')
+        self.user.save()
+
+        # The session auth hash no longer matches, so the session ends.
+        self.assertFalse(self.post()['ok'])
+
+    def test_shared_cache_check(self):
+        self.assertEqual([error.id for error in check_shared_caches()],
+                         ['needley.W001', 'needley.W001'])
+
+        with override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            'graphql': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }):
+            self.assertEqual(check_shared_caches(), [])
+
+
+def login_mutation(username, password):
+    return '''
+        mutation {
+            login(input: {username: "%s", password: "%s"}) {
+                me { username }
+            }
+        }
+    ''' % (username, password)
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user(
+            username='hashed', email='hashed@example.com', password='password', nickname='hashed')
+
+    def test_login(self):
+        result = post_query(login_mutation('hashed', 'password'))
+        self.assertEqual(result['data']['login']['me']
+                         ['username'], 'hashed')
+
+        result = post_query(login_mutation('hashed', 'wrong'))
+        self.assertEqual(result['errors'][0]['message'], 'invalid credentials')
+
+    def test_upgrade_hash(self):
+        self.user.password = make_password('password', hasher='pbkdf2_sha256')
+        self.user.save()
+
+        post_query(login_mutation('hashed', 'password'))
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2'))
+        self.assertTrue(self.user.check_password('password'))
+
+    @override_settings(LOGIN_RATE_LIMITS={'username': (2, 60)})
+    def test_rate_limit(self):
+        for _ in range(2):
+            post_query(login_mutation('hashed', 'wrong'))
+
+        result = post_query(login_mutation('hashed', 'password'))
+        self.assertEqual(result['errors'][0]['message'],
+                         'Too many login attempts. Try again later.')
+
+    @override_settings(LOGIN_RATE_LIMITS={'username': (1, 60)})
+    def test_rate_limit_any_username(self):
+        # Keys memcached would reject fail the test instead of warning
+        def validate_key(key):
+            self.assertEqual(list(memcache_key_warnings(key)), [])
+
+        username = 'name with spaces\u0007' + 'x' * 300
+        with mock.patch('django.core.cache.backends.locmem.LocMemCache.validate_key',
+                        side_effect=validate_key):
+            post_query(login_mutation(username, 'wrong'))
+            result = post_query(login_mutation(username, 'wrong'))
+        self.assertEqual(result['errors'][0]['message'],
+                         'Too many login attempts. Try again later.')
+
+    @override_settings(LOGIN_RATE_LIMITS={'ip': (1, 60)},
+                       TRUSTED_PROXY_HEADER='HTTP_X_FORWARDED_FOR', TRUSTED_PROXY_COUNT=1)
+    def test_rate_limit_behind_proxy(self):
+        def login(forwarded_for):
+            response = Client().post('/graphql', {'query': login_mutation('hashed', 'wrong')},
+                                     HTTP_X_FORWARDED_FOR=forwarded_for)
+            return json.loads(response.content)['errors'][0]['message']
+
+        self.assertEqual(login('10.0.0.1'), 'invalid credentials')
+        self.assertEqual(login('10.0.0.2'), 'invalid credentials')
+        # Addresses made up by the client are ignored.
+        self.assertEqual(login('192.0.2.1, 10.0.0.1'),
+                         'Too many login attempts. Try again later.')
+
+    def test_backpressure(self):
+        pool = HashingPool(workers=0, queue_size=1, timeout=0.01)
+        started = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            started.set()
+            release.wait()
+
+        thread = threading.Thread(target=pool.run, args=(hold,))
+        thread.start()
+        started.wait()
+        try:
+            with self.assertRaises(PasswordHashingBusy):
+                pool.run(hash_password, 'password')
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertTrue(pool.run(hash_password, 'password'))
+
+
+class FakeWebSocket:
+    """Drives an ASGI WebSocket app through in-memory queues."""
+
+    def __init__(self, app, path='/graphql', subprotocols=('graphql-transport-ws',)):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {'type': 'websocket', 'path': path,
+                 'subprotocols': list(subprotocols)}
+        self.task = asyncio.ensure_future(
+            app(scope, self.inbox.get, self.outbox.put))
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+
+    def send_json(self, message):
+        self.inbox.put_nowait(
+            {'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outbox.get(), 1)
+
+    async def receive_json(self):
+        return json.loads((await self.receive())['text'])
+
+    async def close(self):
+        self.inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(self.task, 1)
+
+
+class SubscriptionTests(TestCase):
+    query = 'subscription { newArticle { title excerpt author { nickname } } }'
+
+    def setUp(self):
+        self.author = get_mock_user()
+        self.article = Article.objects.create(
+            title='pushed', content='content', author=self.author)
+
+    async def connect(self):
+        socket = FakeWebSocket(websocket_application)
+        self.assertEqual((await socket.receive())['subprotocol'], 'graphql-transport-ws')
+        socket.send_json({'type': 'connection_init'})
+        self.assertEqual((await socket.receive_json())['type'], 'connection_ack')
+        return socket
+
+    async def test_new_article(self):
+        socket = await self.connect()
+        socket.send_json({'id': '1', 'type': 'subscribe',
+                         'payload': {'query': self.query}})
+        # Let the subscription register with the broker.
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        # A query from the event loop would raise SynchronousOnlyOperation.
+        publish_article(self.article)
+        message = await socket.receive_json()
+
+        self.assertEqual(message, {'id': '1', 'type': 'next', 'payload': {'data': {
+            'newArticle': {'title': 'pushed', 'excerpt': 'content',
+                           'author': {'nickname': self.author.nickname}}}}})
+
+        socket.send_json({'id': '1', 'type': 'complete'})
+        await socket.close()
+
+    async def test_rejects_queries(self):
+        socket = await self.connect()
+        socket.send_json({'id': '1', 'type': 'subscribe',
+                         'payload': {'query': '{ me { ok } }'}})
+
+        message = await socket.receive_json()
+        self.assertEqual(message['type'], 'error')
+        await socket.close()
+
+    async def test_requires_init(self):
+        socket = FakeWebSocket(websocket_application)
+        await socket.receive()
+        socket.send_json({'id': '1', 'type': 'subscribe',
+                         'payload': {'query': self.query}})
+
+        self.assertEqual((await socket.receive())['code'], 4401)
+
+    def test_post_article_publishes(self):
+        with mock.patch.object(InMemoryBroker, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            post_query(post_article_mutation('title', 'content')['mutation'], login_as=True)
+
+        (channel, message) = publish.call_args[0]
+        self.assertEqual(channel, 'articles')
+        self.assertEqual(message['title'], 'title')
+        self.assertNotIn('email', message['author'])
+
+    def test_worker_publishes(self):
+        # Brokers reaching other processes are fed by run_tasks.
+        with mock.patch.object(InMemoryBroker, 'process_local', False), \
+                mock.patch.object(InMemoryBroker, 'publish') as publish, \
+                self.captureOnCommitCallbacks(execute=True):
+            post_query(post_article_mutation('title', 'content')['mutation'], login_as=True)
+            self.assertFalse(publish.called)
+            run_pending()
+
+        (channel, message) = publish.call_args[0]
+        self.assertEqual((channel, message['title'], message['content']),
+                         ('articles', 'title', 'content'))
+
+
+class AuthorStatsTests(TestCase):
+    def setUp(self):
+        caches['graphql'].clear()
+        self.author = get_mock_user()
+
+    def test_post_article(self):
+        post_query(post_article_mutation('first', 'content')
+                   ['mutation'], login_as=self.author)
+        post_query(post_article_mutation('second', 'content')
+                   ['mutation'], login_as=self.author)
+        # Both recounts run in one batch.
+        with CaptureQueriesContext(connection) as queries:
+            run_pending()
+        self.assertEqual(sum('GROUP BY' in query['sql'] for query in queries), 1)
+
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.article_count, 2)
+        self.assertEqual(self.author.last_posted_at,
+                         Article.objects.get(title='second').created_at)
+
+    def test_no_aggregate_queries(self):
+        Article.objects.create(title='title', content='content', author=self.author)
+        run_pending()
+
+        with CaptureQueriesContext(connection) as queries:
+            result = post_query(
+                '{ allUsers { edges { node { articleCount lastPostedAt } } } }')
+
+        self.assertEqual(result['data']['allUsers']['edges'][0]['node']['articleCount'], 1)
+        self.assertFalse(any('needley_article' in query['sql'] for query in queries))
+
+    def test_delete(self):
+        article = Article.objects.create(
+            title='title', content='content', author=self.author)
+        article.delete()
+        call_command('run_tasks', once=True, stdout=io.StringIO())
+
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.article_count, 0)
+        self.assertIsNone(self.author.last_posted_at)
+
+    def test_repair_command(self):
+        Article.objects.bulk_create([
+            Article(title='title', content='content', author=self.author) for _ in range(3)])
+
+        out = io.StringIO()
+        call_command('recompute_author_stats', stdout=out)
+
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.article_count, 3)
+        self.assertIn('repaired 1', out.getvalue())
+
+
+calls = []
+
+
+@task(name='tests.record', max_attempts=2)
+def record_task(value):
+    if value == 'fail':
+        raise ValueError(value)
+    calls.append(value)
+
+
+@task(name='tests.record_batch', batch=True)
+def record_batch_task(payloads):
+    calls.append(sorted(payload['value'] for payload in payloads))
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_run(self):
+        enqueue(record_task, value='a')
+        enqueue(record_task, value='b')
+
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_batch(self):
+        for value in (3, 1, 2):
+            enqueue(record_batch_task, value=value)
+
+        run_pending()
+        self.assertEqual(calls, [[1, 2, 3]])
+
+    def test_retry(self):
+        queued = enqueue(record_task, value='fail')
+
+        with self.assertLogs('needley.tasks', 'ERROR'):
+            run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('ValueError', queued.last_error)
+
+        # Not due until the backoff has passed.
+        self.assertEqual(run_pending(), 0)
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('needley.tasks', 'ERROR'):
+            run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_requeue_stale(self):
+        queued = enqueue(record_task, value='a')
+        Task.objects.update(status=Task.RUNNING,
+                            locked_at=timezone.now() - datetime.timedelta(hours=1))
+
+        out = io.StringIO()
+        call_command('run_tasks', once=True, stdout=out)
+
+        self.assertEqual(calls, ['a'])
+        self.assertIn('Requeued 1 stale tasks', out.getvalue())
+        self.assertFalse(Task.objects.filter(id=queued.id).exists())
+
+    def test_queue_metrics(self):
+        enqueue(record_task, value='a')
+
+        response = Client().get('/metrics')
+        self.assertIn(b'tasks_queued{status="queued",task="tests.record"} 1.0',
+                      response.content)
+
+
+class ArticleContentTests(TestCase):
+    body = ' '.join(['word%d' % idx for idx in range(200)])
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.author = get_mock_user()
+
+    def test_excerpt(self):
+        result = post_query(post_article_mutation(
+            'title', self.body)['mutation'], login_as=self.author)
+        self.assertEqual(
+            result['data']['postArticle']['article']['content'], self.body)
+        article = Article.objects.get()
+        self.assertTrue(article.excerpt.startswith('word0 word1 '))
+        self.assertTrue(article.excerpt.endswith('…'))
+        self.assertLessEqual(len(article.excerpt), 280)
+
+        with CaptureQueriesContext(connection) as context:
+            result = post_query(
+                '{ allArticles { edges { node { excerpt(length: 20) } } } }')
+        node = result['data']['allArticles']['edges'][0]['node']
+        self.assertEqual(node['excerpt'], 'word0 word1 word2…')
+        self.assertFalse(any('"content"' in query['sql']
+                             for query in context.captured_queries))
+
+    @override_settings(ARTICLE_CONTENT_STORAGE='compressed')
+    def test_compressed_storage(self):
+        for idx in range(3):
+            result = post_query(post_article_mutation(
+                f'title {idx}', f'{self.body} {idx}')['mutation'], login_as=self.author)
+            self.assertEqual(result['data']['postArticle']['article']['content'],
+                             f'{self.body} {idx}')
+        self.assertEqual(Article.objects.filter(content='').count(), 3)
+        self.assertEqual(ArticleContent.objects.count(), 3)
+
+        # The page, its count and the bodies of the whole page
+        result, queries = count_queries(
+            '{ allArticles { edges { node { title content } } } }')
+        self.assertEqual(queries, 3)
+        self.assertEqual(
+            [edge['node']['content'] for edge in result['data']['allArticles']['edges']],
+            [f'{self.body} {idx}' for idx in reversed(range(3))])
+
+        # Title edits keep the compressed body.
+        article = Article.objects.first()
+        article.title = 'edited'
+        article.save()
+        self.assertEqual(ArticleContent.objects.count(), 3)
+
+    def test_backfill(self):
+        for idx in range(3):
+            Article.objects.create(
+                title=f'title {idx}', content=f'{self.body} {idx}', author=self.author)
+
+        call_command('backfill_articles', storage='compressed', stdout=io.StringIO())
+        self.assertEqual(ArticleContent.objects.count(), 3)
+        self.assertFalse(Article.objects.exclude(content='').exists())
+        self.assertEqual(sorted(row['content'] for row in export_rows()),
+                         [f'{self.body} {idx}' for idx in range(3)])
+
+        out = io.StringIO()
+        call_command('backfill_articles', storage='inline', stdout=out)
+        self.assertIn('updated 3', out.getvalue())
+        self.assertEqual(ArticleContent.objects.count(), 0)
+        self.assertEqual(sorted(Article.objects.values_list('content', flat=True)),
+                         [f'{self.body} {idx}' for idx in range(3)])
+
+
+class PostArticlesTests(TestCase):
+    mutation = '''
+        mutation ($input: [ArticleInput!]!) {
+            postArticles(input: $input) {
+                articles { title author { nickname articleCount } }
+                errors { index field message }
+            }
+        }
+    '''
+
+    def post(self, articles, login_as=None):
+        return post_json({'query': self.mutation, 'variables': {'input': articles}},
+                         login_as=login_as)
+
+    def test_post_articles(self):
+        author = get_mock_user()
+        result = self.post([
+            {'title': 'first', 'content': 'content'},
+            {'title': '', 'content': 'content'},
+            {'title': 'third', 'content': 'content'},
+        ], login_as=author)
+
+        payload = result['data']['postArticles']
+        self.assertEqual([article and article['title'] for article in payload['articles']],
+                         ['first', None, 'third'])
+        self.assertEqual([(error['index'], error['field']) for error in payload['errors']],
+                         [(1, 'title')])
+        self.assertEqual(sorted(Article.objects.values_list('title', flat=True)),
+                         ['first', 'third'])
+        run_pending()
+        author.refresh_from_db()
+        self.assertEqual(author.article_count, 2)
+
+    def return_bulk_inserts(self):
+        """Make SQLite (3.35+) return the ids of bulk inserts, as PostgreSQL
+        does, so that create_articles takes its bulk_create path."""
+        def return_insert_columns(fields):
+            if not fields:
+                return '', ()
+            return 'RETURNING %s' % ', '.join('%s.%s' % (
+                connection.ops.quote_name(field.model._meta.db_table),
+                connection.ops.quote_name(field.column)) for field in fields), ()
+
+        for patcher in (
+            mock.patch.multiple(connection.features, can_return_columns_from_insert=True,
+                                can_return_rows_from_bulk_insert=True),
+            mock.patch.object(connection.ops, 'return_insert_columns', return_insert_columns),
+            mock.patch.object(connection.ops, 'fetch_returned_insert_rows',
+                              lambda cursor: cursor.fetchall(), create=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(ARTICLE_CONTENT_STORAGE='compressed')
+    def test_bulk_insert(self):
+        caches['graphql'].clear()
+        self.return_bulk_inserts()
+        author = get_mock_user()
+        feed = '{ allArticles { edges { node { title excerpt content } } } }'
+        self.assertEqual(post_query(feed)['data']['allArticles']['edges'], [])
+
+        with CaptureQueriesContext(connection) as context:
+            result = self.post([
+                {'title': 'first', 'content': 'first\n\nbody'},
+                {'title': 'second', 'content': 'second body'},
+            ], login_as=author)
+        inserts = [query for query in context.captured_queries
+                   if query['sql'].startswith('INSERT INTO "needley_article"')]
+        self.assertEqual(len(inserts), 1)
+
+        payload = result['data']['postArticles']
+        self.assertEqual([article['title'] for article in payload['articles']],
+                         ['first', 'second'])
+        articles = list(Article.objects.order_by('id'))
+        self.assertEqual([article.excerpt for article in articles], ['first body', 'second body'])
+        self.assertEqual([article.content for article in articles], ['', ''])
+        self.assertEqual(sorted(ArticleContent.objects.values_list('article_id', flat=True)),
+                         [article.id for article in articles])
+
+        # One recount for the whole batch
+        self.assertEqual(list(Task.objects.values_list('payload', flat=True)),
+                         [{'author_id': author.id}])
+        run_pending()
+        author.refresh_from_db()
+        self.assertEqual(author.article_count, 2)
+        self.assertEqual(author.last_posted_at, articles[-1].created_at)
+
+        # The feed cached before the post was invalidated.
+        self.assertEqual(post_query(feed)['data']['allArticles']['edges'], [
+            {'node': {'title': 'second', 'excerpt': 'second body', 'content': 'second body'}},
+            {'node': {'title': 'first', 'excerpt': 'first body', 'content': 'first\n\nbody'}},
+        ])
+
+    @override_settings(GRAPHQL_MAX_BATCH_SIZE=2)
+    def test_max_batch_size(self):
+        result = self.post([{'title': 'title', 'content': 'content'}] * 3,
+                           login_as=get_mock_user())
+        self.assertIn('errors', result)
+        self.assertFalse(Article.objects.exists())
+
+    def test_requires_login(self):
+        result = self.post([{'title': 'title', 'content': 'content'}])
+        self.assertIn('errors', result)
+        self.assertFalse(Article.objects.exists())
+
+
+class ConditionalGetTests(TestCase):
+    query = 'query Feed { allArticles { edges { node { title } } } }'
+
+    def setUp(self):
+        caches['graphql'].clear()
+        self.author = get_mock_user()
+        Article.objects.create(title='title', content='content', author=self.author)
+
+    def get(self, query=None, login_as=None, **headers):
+        client = Client()
+        if login_as:
+            client.force_login(login_as)
+        return client.get('/graphql', {'query': query or self.query},
+                          HTTP_ACCEPT='application/json', **headers)
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Only the freshness check, a lookup of the table versions
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('needley_tableversion', context.captured_queries[0]['sql'])
+
+        Article.objects.create(title='new', content='content', author=self.author)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_deletes_change_etag(self):
+        Article.objects.create(title='new', content='content', author=self.author)
+        etag = self.get()['ETag']
+        # The latest updated_at stays the same, the row count does not.
+        Article.objects.order_by('created_at').first().delete()
+        self.assertNotEqual(self.get()['ETag'], etag)
+
+    def test_bulk_writes_change_etag(self):
+        etag = self.get()['ETag']
+        # Sends no signals; the table's trigger still counts it.
+        Article.objects.update(title='renamed')
+        self.assertNotEqual(self.get()['ETag'], etag)
+
+    def test_writes_from_other_processes(self):
+        # Such writes never reach this process's cache, only the database.
+        query = '{ allArticles { edges { node { title author { articleCount } } } } }'
+        etag = self.get(query)['ETag']
+        # The recount of the article posted in setUp, as run_tasks would.
+        with mock.patch('needley.cache.invalidate'), mock.patch('needley.auth.invalidate_user'):
+            run_pending()
+        response = self.get(query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Not the response cached before the write, either.
+        articles = json.loads(response.content)['data']['allArticles']['edges']
+        self.assertEqual(articles[0]['node']['author']['articleCount'], 1)
+
+    @override_settings(GRAPHQL_CACHE_CONTROL={'Feed': 'public, max-age=30', '*': 'no-cache'})
+    def test_cache_control(self):
+        self.assertEqual(self.get()['Cache-Control'], 'public, max-age=30')
+        self.assertEqual(self.get(login_as=self.author)['Cache-Control'],
+                         'max-age=30, private')
+        self.assertEqual(self.get('{ allUsers { edges { node { username } } } }')['Cache-Control'],
+                         'no-cache')
+
+    def test_uncacheable(self):
+        response = self.get('{ me { ok } }', login_as=self.author)
+        self.assertFalse(response.has_header('ETag'))
+        response = self.get('{ allArticles { edges { node { unknown } } } }')
+        self.assertFalse(response.has_header('ETag'))
+        response = Client().post('/graphql', {'query': self.query})
+        self.assertFalse(response.has_header('ETag'))
+
+
+class EncodingTests(TestCase):
+    query = '{ allArticles { edges { node { title content } } } }'
+
+    def setUp(self):
+        caches['graphql'].clear()
+        author = get_mock_user()
+        for idx in range(10):
+            Article.objects.create(
+                title=f'title {idx}', content='記事 content ' * 20, author=author)
+
+    def test_serializers_agree(self):
+        payload = {'data': {'node': {'title': '記事 "quoted"\n', 'count': 3,
+                                     'ok': True, 'avatar': None, 'tags': []}}}
+        self.assertEqual(encoding.stdlib_dumps(payload), encoding.fast_dumps(payload))
+        self.assertEqual(json.loads(encoding.stdlib_dumps(payload)), payload)
+
+    @override_settings(GRAPHQL_JSON_SERIALIZER='needley.encoding.stdlib_dumps')
+    def test_configured_serializer(self):
+        result = post_query(self.query)
+        self.assertEqual(len(result['data']['allArticles']['edges']), 10)
+
+    def test_negotiate(self):
+        preferred = encoding.available_encodings()[0]
+        self.assertEqual(encoding.negotiate('gzip, deflate, br'), preferred)
+        self.assertEqual(encoding.negotiate('gzip'), 'gzip')
+        self.assertEqual(encoding.negotiate('br;q=0.5, gzip;q=0.8'), 'gzip')
+        self.assertEqual(encoding.negotiate('*'), preferred)
+        self.assertIsNone(encoding.negotiate('gzip;q=0, br;q=0'))
+        self.assertIsNone(encoding.negotiate('identity'))
+        self.assertIsNone(encoding.negotiate(''))
+
+    def test_compressed_response(self):
+        response = Client().post('/graphql', {'query': self.query},
+                                 HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        result = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(result['data']['allArticles']['edges']), 10)
+
+        # Below the threshold
+        response = Client().post('/graphql', {'query': '{ me { ok } }'},
+                                 HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_compressed_etag(self):
+        client = Client()
+        response = client.get('/graphql', {'query': self.query}, HTTP_ACCEPT='application/json',
+                              HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+        response = client.get('/graphql', {'query': self.query}, HTTP_ACCEPT='application/json',
+                              HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
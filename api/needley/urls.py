@@ -13,11 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_django.views import GraphQLView
+from .metrics import metrics
+from .views import AsyncGraphQLView, GraphQLView, export_articles
+
+GraphQLViewClass = AsyncGraphQLView if settings.GRAPHQL_ASYNC_VIEW else GraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,5 +29,11 @@ urlpatterns = [
     # GraphQL query end point.
     # In production, remove CSRF exempt.
     #path("graphql", GraphQLView.as_view(graphiql=True)),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(GraphQLViewClass.as_view(graphiql=True))),
+
+    # Streaming dump of all articles for analytics.
+    path("export/articles", export_articles),
+
+    # Prometheus scrape target.
+    path("metrics", metrics),
 ]
@@ -0,0 +1,346 @@
+import json
+import threading
+from contextlib import nullcontext
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.http import (HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed,
+                         StreamingHttpResponse)
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import classonlymethod
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView as BaseGraphQLView
+from graphene_django.views import HttpError
+from graphql import (ExecutionResult, GraphQLError, OperationType, execute,
+                     get_operation_ast, validate_schema)
+
+from . import cache, cost, encoding, export, metrics, persisted, profiling, routers
+from .documents import get_document
+from .loaders import Loaders
+
+
+class GraphQLView(BaseGraphQLView):
+    execution_result = None
+    etag = None
+    # Whether get_response produced (or found cached) a result without errors
+    succeeded = False
+
+    def dispatch(self, request, *args, **kwargs):
+        # Queries sent with GET carry an ETag (see cache.get_etag), and a
+        # matching If-None-Match is answered before anything is executed.
+        conditional = self.get_conditional(request)
+        if conditional is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        (etag, cache_control) = conditional
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            self.etag = etag
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or not self.succeeded:
+                return response
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    def get_conditional(self, request):
+        """Return `(etag, cache_control)` for a cacheable GET query, else None."""
+        if request.method != 'GET' or self.graphiql and self.can_display_graphiql(request, {}):
+            return None
+        try:
+            data = self.resolve_persisted_query(request, {})
+            query, variables, operation_name, id = self.get_graphql_params(
+                request, data)
+        except HttpError:
+            return None
+        with routers.read_from_replicas():
+            etag = cache.get_etag(
+                self.schema.graphql_schema, query, variables, operation_name)
+        if etag is None:
+            return None
+
+        # Tagged documents are valid, with a single operation if unnamed.
+        document, _ = get_document(self.schema.graphql_schema, query)
+        operation_ast = get_operation_ast(document, operation_name)
+        name = operation_ast.name.value if operation_ast.name else None
+        policies = getattr(settings, 'GRAPHQL_CACHE_CONTROL', {})
+        return (etag, policies.get(name, policies.get('*', 'no-cache')))
+
+    def get_context(self, request):
+        # Fresh loaders per request so cached rows never leak between users.
+        request.loaders = Loaders()
+        return request
+
+    def get_response(self, request, data, show_graphiql=False):
+        data = self.resolve_persisted_query(request, data)
+
+        key = self.get_cache_key(request, data, show_graphiql)
+        if key is not None:
+            cached = cache.get_response(key)
+            metrics.record_cache_lookup(cached is not None)
+            if cached is not None:
+                # Only successful responses are stored.
+                self.succeeded = True
+                return cached
+
+        self.execution_result = None
+        (result, status_code) = super().get_response(request, data, show_graphiql)
+
+        self.succeeded = self.execution_result is not None and not self.execution_result.errors
+        if key is not None and status_code == 200 and self.succeeded:
+            cache.set_response(key, (result, status_code))
+
+        return (result, status_code)
+
+    def resolve_persisted_query(self, request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+
+        query = request.GET.get('query') or data.get('query')
+        try:
+            resolved = persisted.resolve(query, extensions)
+        except persisted.PersistedQueryError as e:
+            # Clients expect these errors with a 200 so they can retry with the full text.
+            raise HttpError(HttpResponse(str(e)), str(e))
+
+        if resolved == query:
+            return data
+        data = data.copy()
+        data['query'] = resolved
+        return data
+
+    def get_cache_key(self, request, data, show_graphiql):
+        # Only responses to anonymous clients are shared, and clients asking
+        # for a profile want this request to actually run.
+        if show_graphiql or request.user.is_authenticated:
+            return None
+        profile = profiling.get_profile(request)
+        if profile is not None and profile.expose:
+            return None
+        if self.etag is not None:
+            # The tag already identifies the response, and unlike the model
+            # versions it follows writes made by other processes.
+            return cache.RESPONSE_KEY % self.etag.strip('"')
+        query, variables, operation_name, id = self.get_graphql_params(
+            request, data)
+        return cache.get_key(self.schema.graphql_schema, query, variables, operation_name)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        result = self.execute_document(
+            request, query, variables, operation_name, show_graphiql)
+
+        profile = profiling.get_profile(request)
+        if profile is not None:
+            profile.operation = operation_name
+            if profile.expose and result is not None:
+                result.extensions = dict(
+                    result.extensions or {}, profile=profile.summary())
+
+        self.execution_result = result
+        return result
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        profile = profiling.get_profile(request)
+        if profile is None:
+            return middleware
+        return list(middleware or ()) + [profiling.ResolverMiddleware(profile)]
+
+    def json_encode(self, request, d, pretty=False):
+        # graphene-django only serializes data and errors.
+        if self.execution_result is not None and self.execution_result.extensions:
+            d['extensions'] = self.execution_result.extensions
+        if self.pretty or pretty or request.GET.get('pretty'):
+            return super().json_encode(request, d, pretty)
+        return encoding.dumps(d)
+
+    def execute_document(self, request, query, variables, operation_name, show_graphiql):
+        # Same as graphene-django's execute_graphql_request, except that parsed
+        # and validated documents are reused across requests.
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        profile = profiling.get_profile(request)
+        phase = profile.phase if profile is not None else nullcontext
+
+        validation_rules = tuple(self.validation_rules or ()) or None
+        try:
+            with phase('parse'):
+                document, validation_errors = get_document(
+                    schema, query, validation_rules)
+        except GraphQLError as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == 'get'
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ['POST'],
+                    'Can only perform a {} operation from a POST request.'.format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=list(validation_errors))
+
+        if operation_ast is not None and operation_ast.operation == OperationType.SUBSCRIPTION:
+            return ExecutionResult(data=None, errors=[GraphQLError(
+                'Subscriptions are served over WebSocket (see needley/subscriptions.py).')])
+
+        with phase('cost'):
+            query_cost = cost.analyze(
+                schema, document, operation_name, variables)
+        extensions = {'cost': query_cost.as_extension()}
+        cost_errors = cost.check_limits(query_cost)
+        if cost_errors:
+            return ExecutionResult(data=None, errors=cost_errors, extensions=extensions)
+
+        with phase('execute'), metrics.observe_operation(operation_ast) as observation:
+            result = self.execute_operation(
+                request, schema, document, operation_ast, variables, operation_name)
+            observation.failed = bool(result.errors)
+        if result.extensions is None:
+            result.extensions = {}
+        result.extensions.update(extensions)
+        return result
+
+    def execute_operation(self, request, schema, document, operation_ast, variables, operation_name):
+        try:
+            execute_options = {
+                'root_value': self.get_root_value(request),
+                'context_value': self.get_context(request),
+                'variable_values': variables,
+                'operation_name': operation_name,
+                'middleware': self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options['execution_context_class'] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get('ATOMIC_MUTATIONS', False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            if operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+                with routers.read_from_replicas():
+                    return execute(schema, document, **execute_options)
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class AsyncGraphQLView(GraphQLView):
+    """GraphQLView for ASGI servers.
+
+    Django serves synchronous views under ASGI on a single shared thread, so
+    a process handles one GraphQL request at a time. This view is a
+    coroutine instead: the event loop keeps serving other clients while the
+    request (resolvers are plain ORM code) runs on the thread pool executor.
+    """
+    # True runs requests on the shared thread like a sync view (used by tests
+    # so that they see the test transaction).
+    thread_sensitive = False
+
+    def __init__(self, thread_sensitive=None, **kwargs):
+        super().__init__(**kwargs)
+        if thread_sensitive is not None:
+            self.thread_sensitive = thread_sensitive
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        return markcoroutinefunction(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        dispatch = sync_to_async(
+            self.dispatch_in_thread, thread_sensitive=self.thread_sensitive)
+        return await dispatch(request, *args, **kwargs)
+
+    def dispatch_in_thread(self, request, *args, **kwargs):
+        # request_started/request_finished only clean up connections of the
+        # shared thread, so executor threads do it themselves.
+        if not self.thread_sensitive:
+            close_old_connections()
+        profile = profiling.get_profile(request)
+        try:
+            if profile is None or profile.capturing_thread == threading.get_ident():
+                return super().dispatch(request, *args, **kwargs)
+            # The middleware only sees the connections of its own thread.
+            with profiling.capture_queries(profile):
+                return super().dispatch(request, *args, **kwargs)
+        finally:
+            if not self.thread_sensitive:
+                close_old_connections()
+
+
+@require_GET
+def export_articles(request):
+    """Stream all articles with their authors (see needley.export).
+
+    Query parameters: `format` (jsonl or csv) and `after`, a
+    `<created_at>,<id>` checkpoint to resume from. The body is gzipped when
+    the client accepts it.
+    """
+    if not request.user.is_authenticated:
+        return HttpResponse('Authentication required.', status=401)
+
+    format = request.GET.get('format', 'jsonl')
+    if format not in export.FORMATS:
+        return HttpResponseBadRequest('Unknown export format: %s' % format)
+    after = request.GET.get('after')
+    if after:
+        try:
+            after = export.parse_checkpoint(after)
+        except Exception as e:
+            return HttpResponseBadRequest(str(e))
+
+    chunks = export.encode(export.export_rows(after or None), format)
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if gzipped:
+        chunks = export.gzip_chunks(chunks)
+
+    response = StreamingHttpResponse(
+        chunks, content_type='%s; charset=utf-8' % content_type)
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    response['Content-Disposition'] = 'attachment; filename="articles.%s"' % format
+    return response